@@ -0,0 +1,127 @@
+import argparse
+import collections
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+
+from input_v1 import StreamSource, ListSource
+from pool_v1 import run_pool
+
+try:
+  import resource  # Unix only; elsewhere memory limits just aren't enforced
+except ImportError:
+  resource = None
+
+# Runs a batch of independent Brewin programs on a pool of worker processes and reports each one
+# as a JSON object (one per line) as soon as it finishes, in whatever order they finish:
+#
+#   $ python3 batch.py programs/ --jobs 8 --time-limit 5 --memory-limit 256 > results.jsonl
+#   $ python3 batch.py manifest.txt
+#
+# A directory runs every foo.src in it, with foo.in as its input if there is one. A manifest lists
+# one program per line, "foo.src" or "foo.src foo.in", relative to the manifest's directory.
+# Every result has the program's index in the batch, its srcfile, a status (ok, error, timeout,
+# memory or crash), the lines it printed, how long it ran and, unless it's ok, an error with the
+# error type, line number and message.
+#
+# Workers import the interpreter once and run program after program. One that runs past the time
+# limit, or dies, is killed and replaced (see pool_v1), so a runaway program only ever costs its
+# own slot.
+
+DEFAULT_TIME_LIMIT = 10  # seconds
+
+# the .src/.in pairs to run, from a directory or a manifest file
+def find_jobs(path):
+  pairs = []
+  if os.path.isdir(path):
+    for name in sorted(os.listdir(path)):
+      if name.endswith('.src'):
+        srcfile = os.path.join(path, name)
+        inputfile = srcfile[:-len('.src')] + '.in'
+        pairs.append((srcfile, inputfile if os.path.exists(inputfile) else None))
+  else:
+    base = os.path.dirname(path)
+    with open(path) as handle:
+      for line in handle:
+        fields = line.split()
+        if fields and not fields[0].startswith('#'):
+          pairs.append((os.path.join(base, fields[0]), os.path.join(base, fields[1]) if len(fields) > 1 else None))
+  return [{'srcfile': srcfile, 'inputfile': inputfile} for srcfile, inputfile in pairs]
+
+# runs one program to completion in this process and describes how it went
+def run_job(interpreter_lib, index, job):
+  result = {'index': index, 'srcfile': job['srcfile']}
+  # a program without an input file reads None, never the worker's stdin
+  input = StreamSource(job['inputfile']) if job.get('inputfile') else ListSource([])
+  interpreter = interpreter_lib.Interpreter(False, input)
+  start = time.perf_counter()
+  try:
+    with open(job['srcfile']) as handle:
+      program = handle.readlines()
+    interpreter.load(program)  # validated first, as brewin.py and tester.py do
+    interpreter.execute()
+    result['status'] = 'ok'
+  except MemoryError:
+    result['status'] = 'memory'
+    result['error'] = {'type': 'MemoryError', 'line': interpreter.get_error_type_and_line()[1],
+                       'message': 'memory limit exceeded'}
+  except Exception as e:
+    error_type, line = interpreter.get_error_type_and_line()
+    result['status'] = 'error'
+    result['error'] = {'type': error_type.name if error_type else type(e).__name__, 'line': line,
+                       'message': str(e)}
+  finally:
+    input.close()
+  result['seconds'] = time.perf_counter() - start
+  # whatever ran out of memory may well be the output, so don't try to ship it back
+  result['output'] = interpreter.get_output() if result['status'] != 'memory' else []
+  return result
+
+# worker setup: caps its own address space and loads the interpreter once, for run_job to use
+def _batch_setup(module_name, memory_limit):
+  if memory_limit and resource:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+  return functools.partial(run_job, importlib.import_module(module_name))
+
+def _failed_job(index, job, status, message):
+  return {'index': index, 'srcfile': job['srcfile'], 'status': status,
+          'error': {'type': status, 'line': None, 'message': message}, 'seconds': None, 'output': []}
+
+# Runs jobs (see find_jobs) on worker processes (see pool_v1.run_pool), yielding each result as it
+# comes in. memory_limit is in bytes, per worker; time_limit is in seconds, per program. Stopping
+# the iteration early kills whatever is still running.
+def run_batch(jobs, workers=None, time_limit=DEFAULT_TIME_LIMIT, memory_limit=None, module_name='interpreterv2'):
+  importlib.import_module(module_name)  # imported here too, so forked workers start with it loaded
+  workers = workers or os.cpu_count() or 1
+  for index, status, result in run_pool(jobs, _batch_setup, (module_name, memory_limit), workers, time_limit):
+    if status == 'ok':
+      yield result
+    elif status == 'timeout':
+      yield _failed_job(index, jobs[index], 'timeout', f'took longer than {time_limit}s')
+    else:
+      yield _failed_job(index, jobs[index], 'crash', f'worker exited with code {result}')
+
+def main():
+  parser = argparse.ArgumentParser(description='Run a batch of Brewin programs, printing one JSON result per line')
+  parser.add_argument('path', help='a directory of .src (and matching .in) files, or a manifest listing them')
+  parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: one per core)')
+  parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT,
+                      help=f'seconds each program may run (default {DEFAULT_TIME_LIMIT})')
+  parser.add_argument('--memory-limit', type=int, default=None, help='MiB of address space per worker')
+  parser.add_argument('--module', default='interpreterv2', help='interpreter module to run programs with')
+  args = parser.parse_args()
+
+  jobs = find_jobs(args.path)
+  memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit else None
+  statuses = collections.Counter()
+  for result in run_batch(jobs, args.jobs, args.time_limit, memory_limit, args.module):
+    statuses[result['status']] += 1
+    print(json.dumps(result), flush=True)
+  summary = ', '.join(f'{count} {status}' for status, count in sorted(statuses.items()))
+  print(f'{len(jobs)} programs: {summary or "nothing to run"}', file=sys.stderr)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import interpreterv2
+
+# Benchmarks for the interpreter's hot paths. Each benchmark generates a Brewin program sized by
+# --scale and says how many "ops" it performs (loop iterations, calls, lines printed, ...), so
+# results can be reported as ops/sec as well as wall time.
+#
+#   $ python3 bench.py                       # run everything
+#   $ python3 bench.py --save baseline.json  # record a baseline
+#   $ python3 bench.py --compare baseline.json  # flag benchmarks that got slower
+
+# a tight while loop doing integer arithmetic and branching
+def bench_while_loop(scale):
+  n = 20000 * scale
+  program = f'''func main void
+  var int i total
+  while < i {n}
+    if == % i 3 0
+      assign total + total * i 2
+    else
+      assign total - total 1
+    endif
+    assign i + i 1
+  endwhile
+  funccall print total
+endfunc'''
+  return program, n
+
+# naive recursive fibonacci: every call goes through funccall, return and resulti
+def bench_recursion(scale):
+  n = 17 + scale.bit_length()
+  program = f'''func fib n:int int
+  if < n 2
+    return n
+  endif
+  var int a m
+  assign m - n 1
+  funccall fib m
+  assign a resulti
+  assign m - n 2
+  funccall fib m
+  return + a resulti
+endfunc
+
+func main void
+  funccall fib {n}
+  funccall print resulti
+endfunc'''
+  calls = [1, 1]
+  for _ in range(2, n + 1):
+    calls.append(calls[-1] + calls[-2] + 1)
+  return program, calls[n]
+
+# a function with a lot of locals in nested scopes, read and written in a loop
+def bench_many_locals(scale):
+  n = 2000 * scale
+  names = [f'v{i}' for i in range(200)]
+  declarations = '\n'.join(f'  var int {name}' for name in names)
+  body = '\n'.join(f'      assign {name} + {name} i' for name in names[::10])
+  program = f'''func main void
+{declarations}
+  var int i
+  while < i {n}
+    if True
+      var int inner
+{body}
+      assign inner + v0 v199
+    endif
+    assign i + i 1
+  endwhile
+  funccall print v0
+endfunc'''
+  return program, n
+
+# a long prefix expression with variable operands, evaluated on every iteration
+def bench_long_expression(scale):
+  n = 5000 * scale
+  terms = 60
+  expression = '+ ' * (terms - 1) + ' '.join('x' if i % 2 else 'i' for i in range(terms))
+  program = f'''func main void
+  var int i x total
+  assign x 3
+  while < i {n}
+    assign total {expression}
+    assign i + i 1
+  endwhile
+  funccall print total
+endfunc'''
+  return program, n
+
+# lots of small print calls
+def bench_print(scale):
+  n = 20000 * scale
+  program = f'''func main void
+  var int i
+  while < i {n}
+    funccall print "line " i " of output"
+    assign i + i 1
+  endwhile
+endfunc'''
+  return program, n
+
+# building a long string one piece at a time
+def bench_string_build(scale):
+  n = 20000 * scale
+  program = f'''func main void
+  var int i
+  var string s
+  while < i {n}
+    assign s + s "ab"
+    assign i + i 1
+  endwhile
+  var bool done
+  assign done == s ""
+  funccall print done
+endfunc'''
+  return program, n
+
+BENCHMARKS = {
+  'while_loop': bench_while_loop,
+  'recursion': bench_recursion,
+  'many_locals': bench_many_locals,
+  'long_expression': bench_long_expression,
+  'print': bench_print,
+  'string_build': bench_string_build,
+}
+
+def run_program(program):
+  interpreter = interpreterv2.Interpreter(False)
+  interpreter.run(program)
+
+# best wall time over repeat runs, then one extra run under tracemalloc for the peak
+def run_benchmark(name, scale, repeat, measure_memory):
+  source, ops = BENCHMARKS[name](scale)
+  program = [line + '\n' for line in source.split('\n')]
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    run_program(program)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  result = {'ops': ops, 'seconds': best, 'ops_per_sec': ops / best}
+  if measure_memory:
+    tracemalloc.start()
+    run_program(program)
+    result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+  return result
+
+# names of benchmarks whose ops/sec dropped by more than threshold against baseline
+def find_regressions(results, baseline, threshold):
+  regressions = []
+  for name, result in results.items():
+    if name in baseline and result['ops_per_sec'] < baseline[name]['ops_per_sec'] * (1 - threshold):
+      regressions.append(name)
+  return regressions
+
+def format_result(name, result, baseline):
+  line = f'{name:<16} {result["seconds"]:9.3f}s {result["ops_per_sec"]:14,.0f} ops/s'
+  if 'peak_bytes' in result:
+    line += f' {result["peak_bytes"] / 1024:10,.0f} KiB peak'
+  if name in baseline:
+    change = result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+    line += f' {change:+8.1%} vs baseline'
+  return line
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the Brewin interpreter')
+  parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+  parser.add_argument('--scale', type=int, default=1, help='multiply every benchmark\'s size')
+  parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the best time is kept')
+  parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory run')
+  parser.add_argument('--save', metavar='JSON', help='write the results to a baseline file')
+  parser.add_argument('--compare', metavar='JSON', help='compare against a saved baseline')
+  parser.add_argument('--threshold', type=float, default=0.10,
+                      help='fractional ops/sec drop that counts as a regression (default 0.10)')
+  args = parser.parse_args()
+
+  names = args.names or list(BENCHMARKS)
+  unknown = [name for name in names if name not in BENCHMARKS]
+  if unknown:
+    parser.error(f'unknown benchmark(s): {", ".join(unknown)}')
+
+  baseline = {}
+  if args.compare:
+    with open(args.compare) as handle:
+      baseline = json.load(handle)['benchmarks']
+
+  results = {}
+  for name in names:
+    results[name] = run_benchmark(name, args.scale, args.repeat, not args.no_memory)
+    print(format_result(name, results[name], baseline))
+
+  if args.save:
+    with open(args.save, 'w') as handle:
+      json.dump({'scale': args.scale, 'benchmarks': results}, handle, indent=2)
+
+  regressions = find_regressions(results, baseline, args.threshold)
+  if regressions:
+    print(f'Regressions (more than {args.threshold:.0%} slower): {", ".join(regressions)}')
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,74 @@
+import sys
+import time
+
+# Runs one Brewin program, with the program's input on stdin and its output on stdout:
+#
+#   $ python3 -m brewin prog.src < prog.in > prog.out
+#   $ python3 brewin.py prog.src --startup
+#
+# This is the quick way to run a program: only the interpreter core is imported (none of the
+# test harness, argparse, the program cache or the memory meter), input is read through a large
+# buffer, only if the program asks for it, and output is written in large chunks. A Brewin error
+# is reported on stderr, as "ErrorType.NAME_ERROR on line 3: ...", with exit status 1.
+# --startup reports on stderr how long each part of starting up took: importing each module of
+# the interpreter core (like python -X importtime, which also covers Python's own startup),
+# reading, loading and running the program.
+
+USAGE = 'usage: python3 -m brewin [--startup] prog.src < input'
+
+# the interpreter core, dependencies first, so timing each import times that module alone
+CORE_MODULES = ['type', 'value', 'output_v1', 'input_v1', 'intbase', 'env_v1', 'func_v1',
+                'typecheck_v1', 'compile_v1', 'interpreterv2']
+
+def _timed_imports(timings):
+  for name in CORE_MODULES:
+    start = time.perf_counter()
+    __import__(name)
+    timings.append((f'import {name}', time.perf_counter() - start))
+
+def main(args=None):
+  started = time.perf_counter()
+  args = sys.argv[1:] if args is None else args
+  startup = '--startup' in args
+  paths = [arg for arg in args if arg != '--startup']
+  if len(paths) != 1 or paths[0].startswith('-'):
+    print(USAGE, file=sys.stderr)
+    return 2
+
+  timings = []
+  if startup:
+    _timed_imports(timings)
+  import interpreterv2
+  from input_v1 import StreamSource
+  from output_v1 import BufferedSink
+
+  start = time.perf_counter()
+  with open(paths[0]) as handle:
+    program = handle.readlines()
+  timings.append(('read', time.perf_counter() - start))
+
+  interpreter = interpreterv2.Interpreter(False, StreamSource(0), output=BufferedSink())
+  status = 0
+  step = 'load'
+  start = time.perf_counter()
+  try:
+    interpreter.load(program)
+    timings.append((step, time.perf_counter() - start))
+    step = 'run'
+    start = time.perf_counter()
+    interpreter.execute()
+  except Exception as e:
+    if interpreter.get_error_type_and_line()[0] is None:
+      raise  # not a Brewin error, so a bug: let the traceback out
+    print(e, file=sys.stderr)
+    status = 1
+  timings.append((step, time.perf_counter() - start))
+
+  if startup:
+    for name, seconds in timings:
+      print(f'startup: {seconds * 1e6:10.0f} us | {name}', file=sys.stderr)
+    print(f'startup: {(time.perf_counter() - started) * 1e6:10.0f} us | total', file=sys.stderr)
+  return status
+
+if __name__ == '__main__':
+  sys.exit(main())
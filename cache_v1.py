@@ -0,0 +1,59 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# ProgramCache keeps the loaded form of programs (tokens, indents, jump table and function
+# table) on disk, one file per program, named after a hash of the source text and the
+# interpreter's version. Running the same source again costs a single read instead of
+# re-tokenizing it.
+# A changed program hashes to a different file, and bumping the interpreter's CACHE_VERSION
+# orphans every old entry. A file that can't be read or doesn't unpickle cleanly is ignored
+# and rewritten. Entries are pickles, so only point this at a directory you trust.
+class ProgramCache:
+  def __init__(self, directory, version):
+    self.directory = directory
+    self.version = str(version)
+
+  # each line is hashed after its length, so moving a line break always changes the key, even
+  # for lines that don't end in a newline
+  def key(self, program):
+    digest = hashlib.sha256(self.version.encode())
+    for line in program:
+      line = line.encode()
+      digest.update(len(line).to_bytes(8, 'little'))
+      digest.update(line)
+    return digest.hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.directory, f'{key}.brewinc')
+
+  # the entry stored for this program, or None if there isn't a usable one
+  def load(self, program):
+    key = self.key(program)
+    try:
+      with open(self._path(key), 'rb') as handle:
+        entry = pickle.loads(handle.read())
+    except Exception:
+      return None  # missing, unreadable or from an incompatible build
+    if not isinstance(entry, dict) or entry.get('key') != key:
+      return None
+    return entry
+
+  # stores entry (a dict) for this program; the file is written under a temporary name and
+  # renamed into place, so concurrent runs never see half an entry
+  def store(self, program, entry):
+    key = self.key(program)
+    entry = dict(entry, key=key)
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      try:
+        with os.fdopen(fd, 'wb') as handle:
+          handle.write(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(temp_path, self._path(key))
+      except BaseException:
+        os.unlink(temp_path)
+        raise
+    except OSError:
+      pass  # caching is best effort; a read-only or full disk just means no cache
@@ -0,0 +1,366 @@
+from intbase import InterpreterBase, ErrorType
+from type import Type
+from value import TRUE, FALSE, bool_value
+from typecheck_v1 import TypeInference
+
+# The Compiler turns every tokenized line into a closure that the interpreter's run loop calls
+# directly, e.g. ["assign","x","+","x","1"] --> a function that evaluates a prebuilt expression
+# tree and stores the result in x. Statement keywords, literals and operators are all resolved
+# here, once, instead of every time the line executes.
+# Anything malformed compiles to a closure that reports the same error the interpreter always
+# did, and only when (and if) that line is actually executed.
+# Expressions are also type checked here, using the variable types TypeInference can vouch for:
+# every type error found is listed in type_errors, and (in typed mode) an operation whose
+# operands are known to have the right types is compiled without its run-time type checks. Type
+# errors themselves are left to the checked operations, so they're still raised when, and only
+# if, the line runs, after any error its operands raise first.
+class Compiler:
+  MAX_NESTING = 200  # deeper expressions fall back to the iterative stack evaluator
+  BOOLEAN_RESULTS = {'==', '!=', '<', '<=', '>', '>=', '&', '|'}  # the rest give their operands' type
+
+  def __init__(self, interpreter):
+    self.interpreter = interpreter
+    self.constants = {}  # closure -> the Value it always returns, for literals and folded expressions
+    self.binary_ops = set(interpreter.binary_op_list)
+    self.builtins = dict(interpreter.builtins)  # as they were when the program was loaded
+    self.typed = interpreter.typed
+    self.types = {}        # closure -> the Type of every Value it returns, where that's known
+    self.type_errors = []  # (line number, description) for each type error found statically
+    self.func_info = None  # the function the line being compiled belongs to, if it can ever run
+    self.statements = {
+      InterpreterBase.VAR_DEF: self._compile_var,
+      InterpreterBase.ASSIGN_DEF: self._compile_assign,
+      InterpreterBase.FUNCCALL_DEF: self._compile_funccall,
+      InterpreterBase.ENDFUNC_DEF: self._compile_endfunc,
+      InterpreterBase.IF_DEF: self._compile_if,
+      InterpreterBase.ELSE_DEF: self._compile_else,
+      InterpreterBase.ENDIF_DEF: self._compile_endif,
+      InterpreterBase.RETURN_DEF: self._compile_return,
+      InterpreterBase.WHILE_DEF: self._compile_while,
+      InterpreterBase.ENDWHILE_DEF: self._compile_endwhile,
+    }
+
+  # compiles a tokenized program into a list of closures, one per source line
+  def compile_program(self, tokenized_program):
+    self.prepare(tokenized_program)
+    return self.compile_lines(0, len(tokenized_program))
+
+  # sets up to compile the program's lines a piece at a time with compile_lines; given roots,
+  # types are only inferred for the functions reachable from them (see TypeInference)
+  def prepare(self, tokenized_program, roots=None):
+    self.tokenized_program = tokenized_program
+    self.inference = TypeInference(self.interpreter, tokenized_program, roots)
+
+  # closures for lines start up to (not including) end; start should be a func line
+  def compile_lines(self, start, end):
+    code = []
+    self.func_info = None
+    for line_num in range(start, end):
+      tokens = self.tokenized_program[line_num]
+      self.line_num = line_num
+      if tokens and tokens[0] == InterpreterBase.FUNC_DEF:
+        self.func_info = self.inference.function_at(line_num, tokens)
+      code.append(self.compile_line(tokens))
+    return code
+
+  def compile_line(self, tokens):
+    if not tokens:
+      return self.interpreter._blank_line
+    compile_statement = self.statements.get(tokens[0])
+    if compile_statement is None:
+      return self._unknown_command(tokens[0])
+    return compile_statement(tokens[1:])
+
+  def _compile_var(self, args):
+    var = self.interpreter._var
+    var_type = args[0] if args else None
+    names = args[1:]
+    if names and var_type not in self.interpreter.VAR_TYPES:
+      self._type_error(f"Unknown type {var_type}")
+    return lambda: var(var_type, names)
+
+  def _compile_assign(self, args):
+    interpreter = self.interpreter
+    if len(args) < 2:
+      return lambda: interpreter.error(ErrorType.SYNTAX_ERROR,"Invalid assignment statement")
+    vname = args[0]
+    expression = self.compile_expression(args[1:])
+    var_type = self._variable_type(vname)
+    expression_type = self.types.get(expression)
+    if var_type is not None and expression_type is not None:
+      if var_type != expression_type:
+        self._type_error(f"Assigning {expression_type.name} to {vname}, declared {var_type.name}")
+      elif self.typed:
+        assign_typed = interpreter._assign_typed
+        return lambda: assign_typed(vname, expression)
+    assign = interpreter._assign
+    return lambda: assign(vname, expression)
+
+  def _compile_funccall(self, args):
+    interpreter = self.interpreter
+    if not args:
+      return self._deferred_error(ErrorType.SYNTAX_ERROR,"Missing function name to call")
+    builtin = self.builtins.get(args[0])
+    if builtin is None:
+      func_info = interpreter.func_manager.get_function_info(args[0])
+      if func_info is None:
+        return self._deferred_error(ErrorType.NAME_ERROR, "no func")
+      arguments = args[1:]
+      operands = [self.compile_operand(arg) for arg in arguments]
+      if len(func_info.params) == len(operands):
+        for (param, type, by_ref), operand in zip(func_info.params, operands):
+          # only variable arguments are type checked
+          if operand not in self.constants and self.types.get(operand, type) != type:
+            self._type_error(f"Passing {self.types[operand].name} as {param}, declared {type.name}")
+      tail = self._tail_position()
+      if tail is not None:
+        tail_funccall = interpreter._tail_funccall
+        returns = tail == InterpreterBase.RETURN_DEF
+        return lambda: tail_funccall(func_info, arguments, operands, returns)
+      funccall = interpreter._funccall
+      return lambda: funccall(func_info, arguments, operands)
+    operands = [self.compile_operand(arg) for arg in args[1:]]
+    if builtin == interpreter._strtoint and len(operands) == 1 and self.types.get(operands[0], Type.STRING) != Type.STRING:
+      self._type_error("Non-string passed to strtoint")
+    advance = interpreter._advance_to_next_statement
+    def call_builtin():
+      builtin(operands)
+      advance()
+    return call_builtin
+
+  # endfunc, or return for a bare return, if that's the next statement after the line being
+  # compiled, so the call on this line is the last thing its function does; otherwise None
+  def _tail_position(self):
+    tokenized_program = self.tokenized_program
+    for line_num in range(self.line_num + 1, len(tokenized_program)):
+      tokens = tokenized_program[line_num]
+      if not tokens:
+        continue
+      if tokens[0] == InterpreterBase.ENDFUNC_DEF or tokens == [InterpreterBase.RETURN_DEF]:
+        return tokens[0]
+      return None
+    return None
+
+  def _compile_endfunc(self, args):
+    return self.interpreter._endfunc
+
+  def _compile_if(self, args):
+    if not args:
+      return self._deferred_error(ErrorType.SYNTAX_ERROR,"Invalid if syntax")
+    expression = self.compile_expression(args)
+    if self._check_bool(expression, "Non-boolean if expression"):
+      if_bool = self.interpreter._if_bool
+      return lambda: if_bool(expression())
+    if_ = self.interpreter._if
+    return lambda: if_(expression)
+
+  def _compile_else(self, args):
+    return self.interpreter._else
+
+  def _compile_endif(self, args):
+    return self.interpreter._endif
+
+  def _compile_return(self, args):
+    return_ = self.interpreter._return
+    expression = self.compile_expression(args) if args else None
+    expression_type = self.types.get(expression)
+    if self.func_info is not None and expression_type is not None and expression_type != self.func_info.return_type:
+      self._type_error(f"Returning {expression_type.name} from {self.func_info.name}")
+    return lambda: return_(expression)
+
+  def _compile_while(self, args):
+    if not args:
+      return self._deferred_error(ErrorType.SYNTAX_ERROR,"Missing while expression")
+    expression = self.compile_expression(args)
+    if self._check_bool(expression, "Non-boolean while expression"):
+      while_bool = self.interpreter._while_bool
+      return lambda: while_bool(expression())
+    while_ = self.interpreter._while
+    return lambda: while_(expression)
+
+  def _compile_endwhile(self, args):
+    return self.interpreter._endwhile
+
+  def _unknown_command(self, command):
+    def unknown():
+      raise Exception(f'Unknown command: {command}')
+    return unknown
+
+  # the static type of variable name on the line being compiled, if TypeInference knows it
+  def _variable_type(self, name):
+    if self.func_info is None:
+      return None
+    return self.inference.variable_type(self.func_info, name)
+
+  def _type_error(self, description):
+    if self.func_info is not None:  # lines that can't ever run don't count
+      self.type_errors.append((self.line_num, description))
+
+  # whether expression, the condition of an if or while, can run unchecked in typed mode
+  def _check_bool(self, expression, description):
+    expression_type = self.types.get(expression)
+    if expression_type is not None and expression_type != Type.BOOL:
+      self._type_error(description)
+    return self.typed and expression_type == Type.BOOL
+
+  # a closure that raises error_type on whatever line is executing when it's called
+  def _deferred_error(self, error_type, description):
+    interpreter = self.interpreter
+    return lambda: interpreter.error(error_type, description, interpreter.ip)
+
+  # compiles a prefix expression (e.g. + 5 * 6 x) into a closure returning a Value; operands are
+  # evaluated right to left, exactly like the stack evaluator, so the same error wins
+  def compile_expression(self, tokens):
+    try:
+      expression, end = self._compile_prefix(tokens, 0, 0)
+    except (IndexError, RecursionError):
+      expression = None  # ran out of operands, or nested too deep to build a tree
+    if expression is None or end != len(tokens):
+      eval_expression = self.interpreter._eval_expression
+      return lambda: eval_expression(tokens)  # leave malformed expressions to the stack evaluator
+    return expression
+
+  def _compile_prefix(self, tokens, i, depth):
+    if depth > Compiler.MAX_NESTING:
+      raise RecursionError()
+    token = tokens[i]
+    if token in self.binary_ops:
+      left, i = self._compile_prefix(tokens, i + 1, depth + 1)
+      right, i = self._compile_prefix(tokens, i, depth + 1)
+      folded = self._fold_binary(token, left, right)
+      return folded or self._compile_binary(token, left, right), i
+    if token == '!':
+      operand, i = self._compile_prefix(tokens, i + 1, depth + 1)
+      folded = self._fold_not(operand)
+      return folded or self._compile_not(operand), i
+    return self.compile_operand(token), i + 1
+
+  # constant folding: an operator whose operands are all constants becomes a constant itself,
+  # unless evaluating it would fail, in which case it stays as is and fails at runtime instead
+  def _fold_binary(self, op, left, right):
+    if left not in self.constants or right not in self.constants:
+      return None
+    v1 = self.constants[left]
+    v2 = self.constants[right]
+    if v1.type() != v2.type():
+      return None  # a TYPE_ERROR, reported on this line if it ever runs
+    handler = self.interpreter.binary_ops[v1.type()].get(op)
+    if handler is None:
+      return None
+    try:
+      return self._constant(handler(v1,v2))
+    except Exception:
+      return None  # e.g. / 5 0
+
+  def _fold_not(self, operand):
+    if operand not in self.constants or self.constants[operand].type() != Type.BOOL:
+      return None
+    return self._constant(bool_value(not self.constants[operand].value()))
+
+  def _constant(self, value):
+    constant = lambda: value
+    self.constants[constant] = value
+    self.types[constant] = value.type()
+    return constant
+
+  def _compile_binary(self, op, left, right):
+    interpreter = self.interpreter
+    left_type = self.types.get(left)
+    right_type = self.types.get(right)
+    result_type = None
+    if left_type is not None and right_type is not None:
+      handler = interpreter.binary_ops[left_type].get(op)
+      if left_type != right_type:
+        self._type_error(f"Mismatching types {left_type.name} and {right_type.name}")
+      elif handler is None:
+        self._type_error(f"Operator {op} is not compatible with {left_type.name}")
+      else:
+        result_type = Type.BOOL if op in Compiler.BOOLEAN_RESULTS else left_type
+        if self.typed:
+          kernel = interpreter.binary_kernels[left_type].get(op)
+          if kernel is not None:
+            typed_binary = self._compile_kernel(kernel, left, right)
+          else:
+            def typed_binary():
+              v2 = right()
+              return handler(left(),v2)
+          self.types[typed_binary] = result_type
+          return typed_binary
+    handlers = {type: operations.get(op) for type, operations in interpreter.binary_ops.items()}
+    def binary():
+      v2 = right()
+      v1 = left()
+      if v1.type() != v2.type():
+        interpreter.error(ErrorType.TYPE_ERROR,f"Mismatching types {v1.type()} and {v2.type()}", interpreter.ip) #!
+      handler = handlers[v1.type()]
+      if handler is None:
+        interpreter.error(ErrorType.TYPE_ERROR,f"Operator {op} is not compatible with {v1.type()}", interpreter.ip) #!
+      return handler(v1,v2)
+    if result_type is not None:
+      self.types[binary] = result_type
+    return binary
+
+  # an operation whose operand types are known, as a closure that runs its (raw, wrap) kernel on
+  # the operands' Python values directly; a literal operand's value is unwrapped once, here, and a
+  # boolean result is picked from TRUE and FALSE in place
+  def _compile_kernel(self, kernel, left, right):
+    raw, wrap = kernel
+    if right in self.constants:
+      v2 = self.constants[right].v
+      if wrap is bool_value:
+        return lambda: TRUE if raw(left().v,v2) else FALSE
+      return lambda: wrap(raw(left().v,v2))
+    if left in self.constants:
+      v1 = self.constants[left].v
+      if wrap is bool_value:
+        return lambda: TRUE if raw(v1,right().v) else FALSE
+      return lambda: wrap(raw(v1,right().v))
+    if wrap is bool_value:
+      def bool_kernel():
+        v2 = right().v
+        return TRUE if raw(left().v,v2) else FALSE
+      return bool_kernel
+    def kernel():
+      v2 = right().v
+      return wrap(raw(left().v,v2))
+    return kernel
+
+  def _compile_not(self, operand):
+    interpreter = self.interpreter
+    operand_type = self.types.get(operand)
+    if operand_type is not None and operand_type != Type.BOOL:
+      self._type_error(f"Expecting boolean for ! {operand_type.name}")
+    elif operand_type == Type.BOOL and self.typed:
+      typed_not = lambda: FALSE if operand().value() else TRUE
+      self.types[typed_not] = Type.BOOL
+      return typed_not
+    def not_():
+      v1 = operand()
+      if v1.type() != Type.BOOL:
+        interpreter.error(ErrorType.TYPE_ERROR,f"Expecting boolean for ! {v1.type()}", interpreter.ip) #!
+      return FALSE if v1.value() else TRUE
+    if operand_type == Type.BOOL:
+      self.types[not_] = Type.BOOL
+    return not_
+
+  # compiles a single token (e.g., x, 17, True, "foo"): literals are parsed once, up front
+  def compile_operand(self, token):
+    interpreter = self.interpreter
+    if not token:
+      return self._deferred_error(ErrorType.NAME_ERROR,f"Empty token")
+    try:
+      literal = interpreter._parse_literal(token)
+    except ValueError:
+      get_value = interpreter._get_value
+      return lambda: get_value(token)  # e.g. -x: let it fail the same way at runtime
+    if literal is not None:
+      return self._constant(literal)
+    def load():
+      value = interpreter.env_manager.get(token)
+      if value is None:
+        interpreter.error(ErrorType.NAME_ERROR,f"Unknown variable {token}", interpreter.ip) #!
+      return value
+    var_type = self._variable_type(token)
+    if var_type is not None:
+      self.types[load] = var_type
+    return load
@@ -36,3 +36,52 @@ class EnvironmentManager:
   def set(self,symbol, value,):
     high = self.highest(symbol)
     self.environment[(symbol, high)] = value
+
+# ScopedEnvironmentManager has the same interface and shadowing rules as EnvironmentManager,
+# but keeps a binding stack per symbol (innermost scope last) plus the symbols declared at each
+# level, so get/set/declare don't scan every variable and delete only touches the scopes it pops.
+class ScopedEnvironmentManager:
+  def __init__(self):
+    self.environment = {}  # symbol -> [[level, value], ...] sorted by level
+    self.scopes = {}       # level -> symbols declared at that level
+
+  # Gets the data associated a variable name
+  def get(self, symbol):
+    bindings = self.environment.get(symbol)
+    if bindings is None:
+      return None
+    return bindings[-1][1]
+
+  def delete(self,lvl):
+    for level in [level for level in self.scopes if level >= lvl]:
+      for symbol in self.scopes.pop(level):
+        bindings = self.environment.get(symbol)
+        if bindings is None:
+          continue  # already dropped along with a deeper level
+        while bindings and bindings[-1][0] >= lvl:
+          bindings.pop()
+        if not bindings:
+          del self.environment[symbol]
+
+  def highest(self,symbol):
+    bindings = self.environment.get(symbol)
+    if bindings is None:
+      return -1
+    return bindings[-1][0]
+
+  # Sets the data associated with a variable name
+  def declare(self, symbol, value,level):
+    bindings = self.environment.setdefault(symbol, [])
+    i = len(bindings)
+    while i and bindings[i-1][0] > level:  # result variables can land below the innermost scope
+      i -= 1
+    if i and bindings[i-1][0] == level:
+      bindings[i-1][1] = value
+      return
+    bindings.insert(i, [level, value])
+    self.scopes.setdefault(level, []).append(symbol)
+
+  def set(self,symbol, value,):
+    bindings = self.environment.get(symbol)
+    if bindings is not None:  # like EnvironmentManager, assigning an undeclared name is invisible
+      bindings[-1][1] = value
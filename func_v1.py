@@ -1,65 +1,90 @@
 from intbase import InterpreterBase
 from type import Type
 
-# FuncInfo is a class that represents information about a function
-# Right now, the only thing this tracks is the line number of the first executable instruction
-# of the function (i.e., the line after the function prototype: func foo)
+# FuncInfo is a class that represents information about a function: the line number of the
+# first executable instruction of the function (i.e., the line after the function prototype:
+# func foo) plus its call descriptor, which is worked out once when the program is loaded so
+# that a call only has to bind arguments
 class FuncInfo:
-  def __init__(self, start_ip):
+  def __init__(self, name, start_ip):
+    self.name = name
     self.start_ip = start_ip    # line number, zero-based
-    self.return_val = []
-    self.params = {}
+    self.params = []            # (name, Type, by_ref) for each formal parameter, in order
+    self.duplicate_params = False
+    self.return_type = None     # Type of the result, None for void
+    self.result_name = None     # resulti/results/resultb, None for void
 
 # FunctionManager keeps track of every function in the program, mapping the function name
 # to a FuncInfo object (which has the starting line number/instruction pointer) of that function.
 class FunctionManager:
-  def __init__(self, tokenized_program):
+  # parameter type name -> (Type, by_ref)
+  PARAM_TYPES = {
+    InterpreterBase.INT_DEF: (Type.INT, False),
+    InterpreterBase.BOOL_DEF: (Type.BOOL, False),
+    InterpreterBase.STRING_DEF: (Type.STRING, False),
+    InterpreterBase.REFINT_DEF: (Type.INT, True),
+    InterpreterBase.REFBOOL_DEF: (Type.BOOL, True),
+    InterpreterBase.REFSTRING_DEF: (Type.STRING, True),
+  }
+  # return type name -> (Type, result variable)
+  RETURN_TYPES = {
+    InterpreterBase.INT_DEF: (Type.INT, "resulti"),
+    InterpreterBase.BOOL_DEF: (Type.BOOL, "resultb"),
+    InterpreterBase.STRING_DEF: (Type.STRING, "results"),
+    InterpreterBase.VOID_DEF: (None, None),
+  }
+
+  def __init__(self, tokenized_program, previous=None):
     self.func_cache = {}
-    self._cache_function_line_numbers(tokenized_program)
+    # header tokens -> (params, duplicate_params, return_type, result_name), so that the
+    # unchanged functions of the next program the same interpreter loads needn't be parsed again
+    self.signatures = {}
+    self._cache_function_line_numbers(tokenized_program, previous.signatures if previous else {})
 
   def get_function_info(self, func_name):
     if func_name not in self.func_cache:
       return None
     return self.func_cache[func_name]
 
-  def _cache_function_line_numbers(self, tokenized_program):
+  def _cache_function_line_numbers(self, tokenized_program, known):
     for line_num, line in enumerate(tokenized_program):
       if line and line[0] == InterpreterBase.FUNC_DEF:
         func_name = line[1]
-        func_info = FuncInfo(line_num + 1)   # function starts executing on line after funcdef
-
-        if line[2] not in ["bool","int","string","void"]:
-          for i in range(2,len(line)-1):
-            var_type = line[i].split(":")
-            type = var_type[1]
-            if type == "bool":
-              func_info.params[var_type[0]] = Type.BOOL
-            elif type == "int":
-              func_info.params[var_type[0]] = Type.INT
-            elif type == "string":
-              func_info.params[var_type[0]] = Type.STRING
-            elif type == "refint":
-              func_info.params[var_type[0]] = "refint"
-            elif type == "refbool":
-              func_info.params[var_type[0]] = "refbool"
-            elif type == "refstring":
-              func_info.params[var_type[0]] = "refstring"
-
-
-
-
-
-        type = line[len(line) - 1]
-        if type == "bool":
-          func_info.return_val = ["resultb",Type.BOOL]
-        elif type == "int":
-          func_info.return_val = ["resulti",Type.INT]
-        elif type == "string":
-          func_info.return_val = ["results",Type.STRING]
-        elif type == "void":
-          func_info.return_val = ["void",None]
-
-
+        func_info = FuncInfo(func_name, line_num + 1)   # function starts executing on line after funcdef
+        header = tuple(line)
+        signature = self.signatures.get(header) or known.get(header) or FunctionManager._parse_signature(line)
+        self.signatures[header] = signature
+        func_info.params, func_info.duplicate_params, func_info.return_type, func_info.result_name = signature
         self.func_cache[func_name] = func_info
 
+  # (params, duplicate_params, return_type, result_name) for a FuncInfo, from its func line
+  def _parse_signature(line):
+    params = []
+    if line[2] not in FunctionManager.RETURN_TYPES:
+      for i in range(2,len(line)-1):
+        var_type = line[i].split(":")
+        if var_type[1] in FunctionManager.PARAM_TYPES:
+          type, by_ref = FunctionManager.PARAM_TYPES[var_type[1]]
+          params.append((var_type[0], type, by_ref))
+    names = [param[0] for param in params]
+    return_type, result_name = FunctionManager.RETURN_TYPES.get(line[len(line) - 1], (None, None))
+    return params, len(names) != len(set(names)), return_type, result_name
+
+# Frame is one active function call: the function being run, where to resume in the caller, the
+# caller's environment and scope level to restore, and the caller variables that the call's
+# by-reference parameters write back to when it returns. The callee's own parameters live at
+# that same level, so it is also the function's top-level scope, where result variables go.
+# A tail frame replaced its caller's frame (see Interpreter._tail_funccall): when it returns, the
+# caller gets tail_result (or nothing) instead of the function's own result.
+class Frame:
+  __slots__ = ('func_info', 'return_ip', 'env_manager', 'level', 'refs', 'tail', 'tail_result')
 
+  def __init__(self, func_info, return_ip, env_manager, level):
+    self.func_info = func_info
+    self.return_ip = return_ip      # None for main
+    self.env_manager = env_manager  # the caller's environment, None for main
+    self.level = level
+    self.refs = []                  # (caller variable, parameter, None) for each by-ref parameter,
+                                    # or (caller variable, None, Value) for one already settled
+    self.tail = False
+    self.tail_result = None         # (result name, Value) for a tail frame, if the caller gets one
@@ -6,6 +6,10 @@ import threading
 import _thread as thread
 import multiprocessing.pool
 import functools
+import contextlib
+import io
+
+from pool_v1 import run_pool
 
 # Test harness; this file is platform agnostic
 
@@ -55,17 +59,68 @@ def run_test_wrapper(interpreter, test_case):
     print(f'Exception: {e}')
     return 0
 
-def run_all_tests(interpreter, tests):
-  print(f'Running {len(tests)} tests...')
-  results = list(map(lambda test: {
+def format_test_result(test, score):
+  return {
     'name': test['name'],
-    'score': run_test_wrapper(interpreter, test),
+    'score': score,
     'max_score': 1,
     'visibility': 'visible' if test.get('visible', False) else 'after_due_date',
-  }, tests))
+  }
+
+# jobs > 1 runs the tests on that many worker processes (see run_tests_in_pool); results come
+# back in the same order either way
+def run_all_tests(interpreter, tests, jobs=1):
+  print(f'Running {len(tests)} tests...')
+  if jobs > 1:
+    scores = run_tests_in_pool(interpreter, tests, jobs)
+  else:
+    scores = list(map(lambda test: run_test_wrapper(interpreter, test), tests))
+  results = [format_test_result(test, score) for test, score in zip(tests, scores)]
   print(f'{get_score(results)}/{len(tests)} tests passed.')
   return results
 
+# seconds a pooled worker gets per test before it's killed: the scaffold's own limits, 5s for
+# validation plus 5s for the test. Killing the worker is the only timeout in pool mode
+POOL_TEST_TIMEOUT = 10
+
+# whether exit_after and timeout start their timer threads; pool workers turn them off, since
+# run_tests_in_pool already kills a worker that overruns
+thread_timeouts = True
+
+# worker setup: the scaffold (and so the interpreter module) is loaded once per worker, and the
+# pool's kill deadline is its only timeout from then on
+def _pool_setup(scaffold):
+  global thread_timeouts
+  thread_timeouts = False
+  return functools.partial(_run_captured, scaffold)
+
+# runs one test in a pool worker, capturing its console output to send back with its score
+def _run_captured(scaffold, _, test_case):
+  output = io.StringIO()
+  with contextlib.redirect_stdout(output):
+    score = run_test_wrapper(scaffold, test_case)
+  return score, output.getvalue()
+
+# Runs tests across a pool of worker processes (see pool_v1.run_pool) and returns their scores in
+# test order. A test that overruns time_limit is failed and its worker killed and replaced, so no
+# timer thread has to interrupt anything. Each test's output is printed in test order as results
+# arrive.
+def run_tests_in_pool(scaffold, tests, jobs, time_limit=POOL_TEST_TIMEOUT):
+  scores = [None] * len(tests)
+  outputs = [None] * len(tests)
+  printed = 0
+  for index, status, result in run_pool(tests, _pool_setup, (scaffold,), jobs, time_limit):
+    if status == 'ok':
+      scores[index], outputs[index] = result
+    else:
+      reason = f'took longer than {time_limit}s' if status == 'timeout' else 'worker exited'
+      scores[index] = 0
+      outputs[index] = f'Running {tests[index]["srcfile"]}... {reason}  FAILED\n'
+    while printed < len(tests) and outputs[printed] is not None:
+      print(outputs[printed], end='')
+      printed += 1
+  return scores
+
 def format_gradescope_output(results):
   if type(results) == int or type(results) == float:
     return {
@@ -98,6 +153,8 @@ def exit_after(s):
     '''
     def outer(fn):
         def inner(*args, **kwargs):
+            if not thread_timeouts:
+                return fn(*args, **kwargs)
             timer = threading.Timer(s, quit_function, args=[fn.__name__])
             timer.start()
             try:
@@ -124,6 +181,8 @@ def timeout(max_timeout):
         @functools.wraps(item)
         def func_wrapper(*args, **kwargs):
             """Closure for function."""
+            if not thread_timeouts:
+                return item(*args, **kwargs)
             pool = multiprocessing.pool.ThreadPool(processes=1)
             async_result = pool.apply_async(item, args, kwargs)
             # raises a TimeoutError if execution exceeds max_timeout
@@ -0,0 +1,122 @@
+import mmap
+import os
+
+# Input sources supply the lines a Brewin program reads with funccall input. Each one has
+# read_line(), which returns the next line without its newline, or None once input runs out.
+#   ConsoleSource - read from the keyboard with input() (the default)
+#   ListSource    - hand out the lines of a list already in memory
+#   StreamSource  - read lazily from a file, path or file descriptor through a large buffer
+#   MmapSource    - memory-map a file and slice lines out of it, for very large inputs
+# StreamSource and MmapSource only touch their file on the first read, so a program that never
+# asks for input never opens it, and neither holds more than the current line as a str.
+class ConsoleSource:
+  def read_line(self):
+    return input()
+
+  def reset(self):
+    pass
+
+  def close(self):
+    pass
+
+class ListSource:
+  def __init__(self, lines):
+    self.lines = lines
+    self.cursor = 0
+
+  def read_line(self):
+    if self.cursor < len(self.lines):
+      cur_input = self.lines[self.cursor]
+      self.cursor += 1
+      return cur_input
+    else:
+      return None
+
+  def reset(self):
+    self.cursor = 0
+
+  def close(self):
+    pass
+
+# source is a path, a file descriptor or an open text file; paths and descriptors are opened
+# (and later closed) here with a buffer_size read buffer, open files are left to their owner.
+# Only a path can be read again from the start: a descriptor or open file may be a pipe or a
+# terminal, so after a reset it just carries on from wherever it got to
+class StreamSource:
+  def __init__(self, source, buffer_size=1 << 16, encoding='utf-8'):
+    self.source = source
+    self.buffer_size = buffer_size
+    self.encoding = encoding
+    self.file = None
+    self.owns_file = False
+    self.exhausted = False
+
+  def _open(self):
+    if isinstance(self.source, (str, bytes, os.PathLike)):
+      self.file = open(self.source, encoding=self.encoding, buffering=self.buffer_size)
+      self.owns_file = True
+    elif isinstance(self.source, int):
+      self.file = open(self.source, encoding=self.encoding, buffering=self.buffer_size, closefd=False)
+      self.owns_file = True
+    else:
+      self.file = self.source
+
+  def read_line(self):
+    if self.exhausted:
+      return None
+    if self.file is None:
+      self._open()
+    line = self.file.readline()
+    if not line:
+      self.exhausted = True
+      self.close()
+      return None
+    return line[:-1] if line.endswith('\n') else line
+
+  def reset(self):
+    if isinstance(self.source, (str, bytes, os.PathLike)):
+      self.close()  # reopened on the next read
+      self.exhausted = False
+
+  def close(self):
+    if self.owns_file and self.file is not None:
+      self.file.close()
+      self.file = None
+
+class MmapSource:
+  def __init__(self, path, encoding='utf-8'):
+    self.path = path
+    self.encoding = encoding
+    self.map = None
+    self.pos = 0
+    self.exhausted = False
+
+  def read_line(self):
+    if self.exhausted:
+      return None
+    if self.map is None:
+      with open(self.path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+          self.exhausted = True  # an empty file can't be mapped
+          return None
+        self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.pos >= len(self.map):
+      self.exhausted = True
+      self.close()
+      return None
+    end = self.map.find(b'\n', self.pos)
+    if end == -1:
+      end = len(self.map)
+    line = self.map[self.pos:end].decode(self.encoding)
+    self.pos = end + 1
+    return line[:-1] if line.endswith('\r') else line  # match text mode's newline handling
+
+  def reset(self):
+    self.close()
+    self.pos = 0
+    self.exhausted = False
+
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
@@ -1,10 +1,14 @@
 # Base class for our interpreter
+import re
 from enum import Enum
+from output_v1 import ConsoleSink, CaptureSink
+from input_v1 import ConsoleSource, ListSource
 
 class ErrorType(Enum):
   TYPE_ERROR = 1
   NAME_ERROR = 2    # if a variable or function name can't be found
   SYNTAX_ERROR = 3  # used for syntax errors
+  RESOURCE_ERROR = 4  # a limit the interpreter was configured with, e.g. its max call depth
   # Add others here
 
 
@@ -40,20 +44,30 @@ class InterpreterBase:
   OBJECT_DEF = 'object'
   THIS_DEF = 'this'
 
+  FUNC_LINE = re.compile(r'\s*func(\s|#|$)')  # a line that (most likely) starts a function
+  # a quoted string, a bare word, or a lone # (start of a comment) or " (a quote that's never closed);
+  # quoted strings are matched whole, so a # inside one isn't taken for a comment
+  TOKEN_PATTERN = re.compile(r'"[^"]*"|[^\s"#]+|#|"')
+
   # v3 defs
   LAMBDA_DEF = 'lambda'
   ENDLAMBDA_DEF = 'endlambda'
 
   # methods
-  def __init__(self, console_output=True, input=None):
+  def __init__(self, console_output=True, input=None, output=None):
     self.console_output = console_output
-    self.input = input  # if not none, then read input from passed-in list
+    self.input = input  # if not none, then read input from passed-in list or input source
+    self.input_source = InterpreterBase._make_input_source(input)
+    # where printed lines go, see output_v1; by default they're kept and, if console_output, printed
+    self.output_sink = output if output is not None else ConsoleSink() if console_output else CaptureSink()
+    self.scanned = None  # (program, scan) left by validate_program for the run that follows it
+    self.chunks = {}     # lines of a chunk -> its scan, for every chunk of the last program scanned
     self.reset()
 
   # Call to reset I/O for another run of the program
   def reset(self):
-    self.output_log = []
-    self.input_cursor = 0
+    self.output_sink.reset()
+    self.input_source.reset()
     self.error_type = None
     self.error_line = None
 
@@ -61,22 +75,24 @@ class InterpreterBase:
   def run(self, program):
     pass
 
-  def get_input(self):
-    if not self.input:
-      return input()  # Get input from keyboard if not input list provided
+  # input can be a list of lines, anything with read_line() (see input_v1), or empty for the keyboard
+  def _make_input_source(input):
+    if not input:
+      return ConsoleSource()  # Get input from keyboard if not input list provided
+    if hasattr(input, 'read_line'):
+      return input
+    return ListSource(input)
 
-    if self.input_cursor < len(self.input):
-      cur_input = self.input[self.input_cursor]
-      self.input_cursor += 1
-      return cur_input
-    else:
-      return None
+  def get_input(self):
+    self.output_sink.flush()  # let any prompt out before we block
+    return self.input_source.read_line()
 
   # students must call this for any errors that they run into
   def error(self, error_type, description=None, line_num=None):
     # log the error before we throw
     self.error_line = line_num
     self.error_type = error_type
+    self.output_sink.flush()
 
     if description:
        description = ': ' + description
@@ -88,24 +104,114 @@ class InterpreterBase:
       raise Exception(f'{error_type} on line {line_num}{description}')
 
   def output(self, v):
-    if self.console_output:
-      print(v)
-    self.output_log.append(v)
+    self.output_sink.write(v)
 
   def get_output(self):
-    return self.output_log
+    return self.output_sink.get_output()
 
   def get_error_type_and_line(self):
     return self.error_type, self.error_line
 
   def validate_program(self, program):
-   first_tokens = [tokens[0] if tokens else '' for tokens in
-                   [line.split(InterpreterBase.COMMENT_DEF)[0].split() for line in program]]
-   indents = [len(line) - len(line.lstrip(' ')) for line in program]
-   self.__validate_blocks(first_tokens,indents)
-   self.__validate_indentation(first_tokens,indents)
+   scan = self._scan_program(program)
+   self.scanned = (program, scan)
+   tokenized_program, indents, indentation_ok = scan[0], scan[1], scan[4]
+   if not (indentation_ok and tokenized_program):
+     first_tokens = [tokens[0] if tokens else '' for tokens in tokenized_program]
+     self.__validate_indentation(first_tokens,indents)
+
+  # one pass over the program's text for everything the validator and the interpreter need:
+  # (tokens per line, indents per line, block jumps from _match_blocks, lines with mismatched
+  # quotes, whether every chunk's indentation is known to be fine on its own). Lines with
+  # mismatched quotes are only reported, so that validation doesn't fail on them; they get the
+  # tokens before their comment, split on whitespace, as the validator used.
+  # The program is scanned a chunk (roughly, a function) at a time, and this interpreter keeps
+  # the scan of every chunk until it scans the next program: a chunk whose text hasn't changed
+  # since then is reused as is, just shifted to wherever it is in the file now, so editing one
+  # function of a big program and loading it again on the same interpreter only rescans that
+  # function. Nothing is shared between interpreters, or kept on disk
+  def _scan_program(self, program):
+    scanned, self.scanned = self.scanned, None
+    if scanned is not None and scanned[0] is program:
+      return scanned[1]  # validate_program just scanned this very list
+    tokenized_program = []
+    indents = []
+    first_tokens = []
+    mismatched_quotes = []
+    jumps = []
+    indentation_ok = True
+    chunks = {}
+    for start, end in InterpreterBase._chunk_bounds(program):
+      lines = tuple(program[start:end])
+      chunk = chunks.get(lines) or self.chunks.get(lines) or self._scan_chunk(lines)
+      chunks[lines] = chunk
+      chunk_tokens, chunk_indents, chunk_first_tokens, chunk_mismatched, chunk_jumps, chunk_indentation_ok = chunk
+      indentation_ok = indentation_ok and chunk_indentation_ok
+      tokenized_program += chunk_tokens
+      indents += chunk_indents
+      first_tokens += chunk_first_tokens
+      mismatched_quotes += [start + line_num for line_num in chunk_mismatched]
+      if jumps is not None and chunk_jumps is not None:
+        jumps += [start + jump if jump is not None else None for jump in chunk_jumps]
+      else:
+        jumps = None
+    self.chunks = chunks
+    if jumps is None:
+      jumps = self._match_blocks(first_tokens, indents)  # blocks span chunks, or there's an error
+    return tokenized_program, indents, jumps, mismatched_quotes, indentation_ok
+
+  # the tokens of one line in a single regex pass, or None if the line has mismatched quotes; it
+  # lives here rather than in tokenise.py so the scanner only needs what grader.zip ships
+  def tokenize_line(line):
+    tokens = InterpreterBase.TOKEN_PATTERN.findall(line)
+    if '#' in tokens:
+      del tokens[tokens.index('#'):]
+    if '"' in tokens:
+      return None
+    return tokens
+
+  # (start, end) line ranges that cover the program, each starting at a func line where it can
+  # (a cheap guess that's only there to make chunks line up with functions)
+  def _chunk_bounds(program):
+    starts = [line_num for line_num, line in enumerate(program) if line_num and InterpreterBase.FUNC_LINE.match(line)]
+    return zip([0] + starts, starts + [len(program)])
+
+  # _scan_program for one chunk of lines, numbered from 0, plus its first tokens; its jumps are
+  # None unless every block in it is closed in it, without any error, so they're the same as in
+  # the whole program's
+  def _scan_chunk(self, lines):
+    tokenized_program = []
+    indents = []
+    first_tokens = []
+    mismatched_quotes = []
+    tokenize_line = InterpreterBase.tokenize_line
+    for line_num, line in enumerate(lines):
+      tokens = tokenize_line(line)
+      if tokens is None:
+        mismatched_quotes.append(line_num)
+        tokens = line.split(InterpreterBase.COMMENT_DEF)[0].split()
+      tokenized_program.append(tokens)
+      first_tokens.append(tokens[0] if tokens else '')
+      indents.append(len(line) - len(line.lstrip(' ')))
+    jumps, error, unclosed = self._pair_blocks(first_tokens, indents)
+    if error is not None or unclosed:
+      jumps = None
+    indentation_ok = InterpreterBase._check_indentation(first_tokens, indents)
+    return tokenized_program, indents, first_tokens, mismatched_quotes, jumps, indentation_ok
+
+  # pairs every block opener with the line that closes it: if -> else/endif, else -> endif,
+  # while -> endwhile, endwhile -> while and func -> endfunc; returns a list indexed by line
+  def _match_blocks(self, first_tokens, indents):
+    jumps, error, unclosed = self._pair_blocks(first_tokens, indents)
+    if error is not None:
+      self.error(ErrorType.SYNTAX_ERROR, *error)
+    return jumps
 
-  def __validate_blocks(self, first_tokens, indents):
+  # _match_blocks, but returning (jumps, (description, line) of the first syntax error or None,
+  # whether any block is left open at the end) instead of raising
+  def _pair_blocks(self, first_tokens, indents):
+    jumps = [None] * len(first_tokens)
+    elses = {}  # if line -> else lines seen so far for that if
     stack = []
     for i in range(0,len(first_tokens)):
       if not first_tokens[i]:
@@ -124,19 +230,30 @@ class InterpreterBase:
       if first_tokens[i] in [InterpreterBase.ENDFUNC_DEF, InterpreterBase.ENDIF_DEF,
                              InterpreterBase.ELSE_DEF, InterpreterBase.ENDWHILE_DEF]:
         if not stack:
-          self.error(ErrorType.SYNTAX_ERROR,f'Mismatched {first_tokens[i]} on line {i}', i)
+          return jumps, (f'Mismatched {first_tokens[i]} on line {i}', i), True
         top_item = stack.pop()
         if first_tokens[i] == InterpreterBase.ELSE_DEF:
           # valdiate else and then put the endif back on the stack to be found for real endif
           if top_item[1] == InterpreterBase.ENDIF_DEF and top_item[2] == indents[i]:
+            elses.setdefault(top_item[0], []).append(i)
             stack.append(top_item) # reappend endif for later
             continue
-          self.error(ErrorType.SYNTAX_ERROR,f'Mismatched else', i)
+          return jumps, (f'Mismatched else', i), True
 
         if top_item[1] != first_tokens[i] or top_item[2] != indents[i]:
-          self.error(ErrorType.SYNTAX_ERROR,f'Missing {top_item[1]} for block on line {top_item[0]}', top_item[0])
+          return jumps, (f'Missing {top_item[1]} for block on line {top_item[0]}', top_item[0]), True
+        else_lines = elses.pop(top_item[0], [])
+        for else_line in else_lines:
+          jumps[else_line] = i
+        jumps[top_item[0]] = else_lines[0] if else_lines else i
+        if first_tokens[i] == InterpreterBase.ENDWHILE_DEF:
+          jumps[i] = top_item[0]
+    return jumps, None, bool(stack)
 
-  def __validate_indentation(self, first_tokens, indents):
+  # (the first line whose indentation doesn't fit the blocks open around it, or None, the indents
+  # of the blocks still open after the last line); lines that open or close a block line up with
+  # its opener, everything else sits further in
+  def _indentation_break(first_tokens, indents):
     stack = []
     for i in range(0,len(first_tokens)):
       if not first_tokens[i]:
@@ -144,16 +261,25 @@ class InterpreterBase:
 
       if first_tokens[i] in [InterpreterBase.FUNC_DEF,InterpreterBase.IF_DEF,InterpreterBase.WHILE_DEF]:
         if stack and indents[i] <= stack[-1]:
-          break
+          return i, stack
         stack.append(indents[i])
       elif first_tokens[i] in [InterpreterBase.ENDFUNC_DEF, InterpreterBase.ENDIF_DEF,
                                InterpreterBase.ELSE_DEF, InterpreterBase.ENDWHILE_DEF]:
-        if indents[i] != stack[-1]:
-          break
+        if not stack or indents[i] != stack[-1]:
+          return i, stack
         if first_tokens[i] != InterpreterBase.ELSE_DEF:
           stack.pop()
-      elif indents[i] <= stack[-1]:
-        break
+      elif not stack or indents[i] <= stack[-1]:
+        return i, stack
+    return None, stack
+
+  # whether lines that start with no block open pass __validate_indentation and leave no block
+  # open; when every chunk of a program does, so does the whole program
+  def _check_indentation(first_tokens, indents):
+    bad_line, open_blocks = InterpreterBase._indentation_break(first_tokens, indents)
+    return bad_line is None and not open_blocks
 
-    if i < len(first_tokens)-1:
-      self.error(ErrorType.SYNTAX_ERROR,f'Bad indentation on line {i}', i)
+  def __validate_indentation(self, first_tokens, indents):
+    bad_line, _ = InterpreterBase._indentation_break(first_tokens, indents)
+    if bad_line is not None and bad_line < len(first_tokens)-1:
+      self.error(ErrorType.SYNTAX_ERROR,f'Bad indentation on line {bad_line}', bad_line)
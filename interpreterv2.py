@@ -1,102 +1,287 @@
+import functools
+import operator
 from type import Type
 from intbase import InterpreterBase, ErrorType
-from env_v1 import EnvironmentManager
-from tokenise import Tokenizer
-from func_v1 import FunctionManager
-
-# Represents a value, which has a type and its value
-class Value:
-  def __init__(self, type, value = None):
-    self.t = type
-    self.v = value
-
-  def value(self):
-    return self.v
-
-  def set(self, other):
-    self.t = other.t
-    self.v = other.v
-
-  def type(self):
-    return self.t
+from env_v1 import ScopedEnvironmentManager
+from func_v1 import FunctionManager, Frame
+from compile_v1 import Compiler
+from value import Value, TRUE, FALSE, EMPTY_STRING, int_value, bool_value, concat
 
 # Main interpreter class
 class Interpreter(InterpreterBase):
-  def __init__(self, console_output=True, input=None, trace_output=False):
-    super().__init__(console_output, input)
-    self._setup_operations()  # setup all valid binary operations and the types they work on
+  VAR_TYPES = {InterpreterBase.INT_DEF: Type.INT, InterpreterBase.STRING_DEF: Type.STRING,
+               InterpreterBase.BOOL_DEF: Type.BOOL}
+  # bump whenever the loaded form of a program (tokens, jumps, FuncInfo, ...) changes shape,
+  # to invalidate every ProgramCache entry written by older versions
+  CACHE_VERSION = 3
+  # the value a new variable (or a result that was never returned) starts out with
+  DEFAULT_VALUES = {Type.INT: int_value(0), Type.STRING: EMPTY_STRING, Type.BOOL: FALSE}
+  # the result variable a registered builtin's return value goes in, by its type
+  RESULT_NAMES = {type: result_name for type, result_name in FunctionManager.RETURN_TYPES.values()}
+  # lookup table of code to run for different operators on different types; none of it depends on
+  # the instance, so it's built once here and shared by every interpreter
+  BINARY_OP_LIST = ['+','-','*','/','%','==','!=', '<', '<=', '>', '>=', '&', '|']
+  BINARY_OPS = {}
+  BINARY_OPS[Type.INT] = {
+    '+': lambda a,b: int_value(a.value()+b.value()),
+    '-': lambda a,b: int_value(a.value()-b.value()),
+    '*': lambda a,b: int_value(a.value()*b.value()),
+    '/': lambda a,b: int_value(a.value()//b.value()),  # // for integer ops
+    '%': lambda a,b: int_value(a.value()%b.value()),
+    '==': lambda a,b: TRUE if a.value()==b.value() else FALSE,
+    '!=': lambda a,b: TRUE if a.value()!=b.value() else FALSE,
+    '>': lambda a,b: TRUE if a.value()>b.value() else FALSE,
+    '<': lambda a,b: TRUE if a.value()<b.value() else FALSE,
+    '>=': lambda a,b: TRUE if a.value()>=b.value() else FALSE,
+    '<=': lambda a,b: TRUE if a.value()<=b.value() else FALSE,
+  }
+  BINARY_OPS[Type.STRING] = {
+    '+': concat,  # builds a RopeValue once the string gets long
+    '==': lambda a,b: TRUE if a.value()==b.value() else FALSE,
+    '!=': lambda a,b: TRUE if a.value()!=b.value() else FALSE,
+    '>': lambda a,b: TRUE if a.value()>b.value() else FALSE,
+    '<': lambda a,b: TRUE if a.value()<b.value() else FALSE,
+    '>=': lambda a,b: TRUE if a.value()>=b.value() else FALSE,
+    '<=': lambda a,b: TRUE if a.value()<=b.value() else FALSE,
+  }
+  BINARY_OPS[Type.BOOL] = {
+    '&': lambda a,b: TRUE if a.value() and b.value() else FALSE,
+    '==': lambda a,b: TRUE if a.value()==b.value() else FALSE,
+    '!=': lambda a,b: TRUE if a.value()!=b.value() else FALSE,
+    '|': lambda a,b: TRUE if a.value() or b.value() else FALSE
+  }
+  # the same operations as BINARY_OPS, as (raw, wrap) kernels: raw works on the operands' Python
+  # values and wrap turns its result into a Value. The compiler uses them where it knows both
+  # operand types (see Compiler._compile_kernel), so they have to agree with BINARY_OPS. String +
+  # has none, since the Python value of a RopeValue is the very thing it puts off building
+  BINARY_KERNELS = {}
+  BINARY_KERNELS[Type.INT] = {
+    '+': (operator.add, int_value),
+    '-': (operator.sub, int_value),
+    '*': (operator.mul, int_value),
+    '/': (operator.floordiv, int_value),
+    '%': (operator.mod, int_value),
+    '==': (operator.eq, bool_value),
+    '!=': (operator.ne, bool_value),
+    '>': (operator.gt, bool_value),
+    '<': (operator.lt, bool_value),
+    '>=': (operator.ge, bool_value),
+    '<=': (operator.le, bool_value),
+  }
+  BINARY_KERNELS[Type.STRING] = {
+    '==': (operator.eq, bool_value),
+    '!=': (operator.ne, bool_value),
+    '>': (operator.gt, bool_value),
+    '<': (operator.lt, bool_value),
+    '>=': (operator.ge, bool_value),
+    '<=': (operator.le, bool_value),
+  }
+  BINARY_KERNELS[Type.BOOL] = {
+    '&': (operator.and_, bool_value),
+    '==': (operator.eq, bool_value),
+    '!=': (operator.ne, bool_value),
+    '|': (operator.or_, bool_value),
+  }
+
+  def __init__(self, console_output=True, input=None, trace_output=False,
+               env_manager_class=ScopedEnvironmentManager, profile=False, output=None, cache_dir=None,
+               max_depth=None, memory=None, typed=True, lazy=True):
+    super().__init__(console_output, input, output)
+    self.binary_op_list = Interpreter.BINARY_OP_LIST
+    self.binary_ops = Interpreter.BINARY_OPS
+    self.binary_kernels = Interpreter.BINARY_KERNELS
+    # funccall name -> handler(operands) for the functions the interpreter itself provides; the
+    # compiler binds each call to its handler, so adding one (see register_builtin) costs nothing
+    self.builtins = {InterpreterBase.PRINT_DEF: self._print, InterpreterBase.INPUT_DEF: self._input,
+                     InterpreterBase.STRTOINT_DEF: self._strtoint}
     self.trace_output = trace_output
+    self.env_manager_class = env_manager_class  # EnvironmentManager for the original flat dict
+    self.profile = profile  # if set, each run leaves a Profiler with per-line timings in self.profiler
+    self.profiler = None
+    # if set, a call that would make more than this many active frames (main's included) is a
+    # RESOURCE_ERROR; tail calls reuse their caller's frame, so they never count
+    self.max_depth = max_depth
+    # run expressions the compiler could type check ahead of time without run-time type checks;
+    # behaviour is the same either way, type errors included (see Compiler)
+    self.typed = typed
+    self.type_errors = []  # the type errors the compiler found in the last program loaded
+    # compile each function the first time it's called, not when the program is loaded, and only
+    # infer types for the functions main can reach; a function that never runs is never compiled,
+    # so its type errors don't show up in type_errors (check_types() always compiles everything)
+    self.lazy = lazy
+    # if set, a MemoryMeter that accounts for (and can cap) the variables, strings, calls and output
+    # of each run, and is left holding that run's numbers; metering needs the scoped environments
+    self.memory = memory
+    self.limit_errors = ()  # the exceptions a run turns into a RESOURCE_ERROR; none without a meter
+    if memory is not None:
+      from memory_v1 import MemoryLimitExceeded, MeteredEnvironmentManager  # only needed with a meter
+      if env_manager_class is not ScopedEnvironmentManager:
+        raise ValueError('memory metering needs ScopedEnvironmentManager environments')
+      self.env_manager_class = functools.partial(MeteredEnvironmentManager, memory)
+      self.limit_errors = (MemoryLimitExceeded,)
+    self.func_manager = None  # the loaded program's functions (the last one's, until the next is loaded)
+    # if set, programs that pass validation are cached on disk here, and the same source validated
+    # or run again is loaded from its entry without being scanned at all
+    self.program_cache = None
+    if cache_dir:
+      from cache_v1 import ProgramCache  # imported only when needed, to keep startup quick (see brewin.py)
+      self.program_cache = ProgramCache(cache_dir, Interpreter.CACHE_VERSION)
+    self.cached = None     # (program, entry) validate_program found in the cache, for the load after it
+    self.validated = None  # the program validate_program last passed without the cache's help
+
+  # a program with a cache entry passed validation when the entry was stored, so it isn't
+  # scanned again; the entry is kept for the _load that follows
+  def validate_program(self, program):
+    entry = self.program_cache.load(program) if self.program_cache else None
+    if entry is not None:
+      self.cached = (program, entry)
+      return
+    super().validate_program(program)
+    self.validated = program
 
   # run a program, provided in an array of strings, one string per line of source code
   def run(self, program):
-    self.level = 1;
-    self.levels = []
-    self.map = []
-    self.functions = []
+    self._prepare(program)
+    self._execute()
+
+  # validate, tokenize and compile a program once, so execute() can run it again and again
+  # with none of that work repeated
+  def load(self, program):
+    self.validate_program(program)
+    self._prepare(program)
+
+  # run the program from the last load() (or run()) from a clean slate: fresh variables, empty
+  # output and, if given, new input (a list of lines or an input source, as for __init__)
+  def execute(self, input=None):
+    if input is not None:
+      self.input_source.close()  # the last run's source may still have its file open
+      self.input = input
+      self.input_source = InterpreterBase._make_input_source(input)
+    self.reset()
+    self._execute()
+
+  # makes name a builtin function for programs loaded after this. handler(interpreter, args) gets
+  # the argument Values and may return a Value, which is stored in resulti, results or resultb by
+  # its type, like a user function's return value. Builtins shadow user functions of the same name.
+  def register_builtin(self, name, handler):
+    def builtin(operands):
+      value = handler(self, [operand() for operand in operands])
+      if value is not None:
+        self._declare_result(Interpreter.RESULT_NAMES[value.type()], value)
+    self.builtins[name] = builtin
+
+  # type checks a program without running it: a list of (line number, description) for every
+  # type error it would hit if the line involved ran
+  def check_types(self, program):
+    self._prepare(program, False)
+    return self.type_errors
+
+  def _prepare(self, program, lazy=None):
     self.program = program
-    self.updates = {}
-    self._compute_indentation(program)  # determine indentation of every line
-    self.tokenized_program = Tokenizer.tokenize_program(program)
-    self.func_manager = FunctionManager(self.tokenized_program)
+    self._load(program)
+    self.compiler = compiler = Compiler(self)
+    if lazy is None:
+      lazy = self.lazy and not self.profile  # so compiling doesn't count against any line's time
+    if lazy:
+      compiler.prepare(self.tokenized_program, [InterpreterBase.MAIN_FUNC])
+      self.code = [self._compile_on_demand] * len(self.tokenized_program)
+    else:
+      self.code = compiler.compile_program(self.tokenized_program)  # one closure per line
+    self.type_errors = compiler.type_errors
+
+  # what every line's code starts out as in lazy mode: compiles the function the line is in,
+  # replacing this with the real closures for all of its lines, then runs the line
+  def _compile_on_demand(self):
+    ip = self.ip
+    start = ip
+    while start >= 0:
+      tokens = self.tokenized_program[start]
+      if tokens and tokens[0] == InterpreterBase.FUNC_DEF and (self.jumps[start] is None or self.jumps[start] >= ip):
+        break
+      start -= 1
+    if start < 0:
+      start = end = ip  # not in any function
+    else:
+      end = self.jumps[start] if self.jumps[start] is not None else len(self.code) - 1
+    self.code[start:end + 1] = self.compiler.compile_lines(start, end + 1)
+    self.code[ip]()
+
+  def _execute(self):
+    self.level = 1;
     self.ip = self._find_first_instruction(InterpreterBase.MAIN_FUNC)
-    self.return_stack = []
+    self.frames = [Frame(self.func_manager.get_function_info(InterpreterBase.MAIN_FUNC), None, None, self.level)]
     self.terminate = False
-    self.env_manager = EnvironmentManager() # used to track variables/scope
+    if self.memory is not None:
+      self.memory.reset()
+      self.memory.called(1)
+    self.env_manager = self.env_manager_class() # used to track variables/scope
 
     # main interpreter run loop
-    while not self.terminate:
-      self._process_line()
-
-  def _process_line(self):
-    if self.trace_output:
-      print(f"{self.ip:04}: {self.program[self.ip].rstrip()}")
-    tokens = self.tokenized_program[self.ip]
-    if not tokens:
-      self._blank_line()
+    code = self.code
+    try:
+      if self.profile:
+        self._run_profiled()
+      elif self.trace_output:
+        while not self.terminate:
+          print(f"{self.ip:04}: {self.program[self.ip].rstrip()}")
+          code[self.ip]()
+      else:
+        while not self.terminate:
+          code[self.ip]()
+    except self.limit_errors as e:
+      super().error(ErrorType.RESOURCE_ERROR, str(e), self.ip)
+    finally:
+      self.output_sink.flush()
+
+  # sets up tokenized_program, indents, jumps and func_manager for program, from the cache if we
+  # can; only a program that just passed validate_program is stored
+  def _load(self, program):
+    cached, self.cached = self.cached, None
+    validated, self.validated = self.validated, None
+    if cached is not None and cached[0] is program:
+      entry = cached[1]
+    else:
+      entry = self.program_cache.load(program) if self.program_cache else None
+    if entry is not None:
+      self.scanned = None  # whatever validate_program last scanned, it won't be needed now
+      self.tokenized_program = entry['tokens']
+      self.indents = entry['indents']
+      self.jumps = entry['jumps']
+      self.func_manager = entry['functions']
       return
-
-    args = tokens[1:]
-
-    match tokens[0]:
-      case InterpreterBase.VAR_DEF:
-        self._var(args)
-      case InterpreterBase.ASSIGN_DEF:
-        self._assign(args)
-      case InterpreterBase.FUNCCALL_DEF:
-        self._funccall(args)
-      case InterpreterBase.ENDFUNC_DEF:
-        self._endfunc()
-      case InterpreterBase.IF_DEF:
-        self._if(args)
-      case InterpreterBase.ELSE_DEF:
-        self._else()
-      case InterpreterBase.ENDIF_DEF:
-        self._endif()
-      case InterpreterBase.RETURN_DEF:
-        self._return(args)
-      case InterpreterBase.WHILE_DEF:
-        self._while(args)
-      case InterpreterBase.ENDWHILE_DEF:
-        self._endwhile(args)
-      case default:
-        raise Exception(f'Unknown command: {tokens[0]}')
+    self.tokenized_program, self.indents, self.jumps, mismatched_quotes, _ = self._scan_program(program)
+    if mismatched_quotes:
+      super().error(ErrorType.SYNTAX_ERROR, 'Mismatched quotes', mismatched_quotes[0])
+    self.func_manager = FunctionManager(self.tokenized_program, self.func_manager)
+    if self.program_cache and validated is program:
+      self.program_cache.store(program, {'tokens': self.tokenized_program, 'indents': self.indents,
+                                         'jumps': self.jumps, 'functions': self.func_manager})
+
+  # the run loop with timing around every line; kept separate so the normal loop stays tight
+  def _run_profiled(self):
+    from profile_v1 import Profiler
+    self.profiler = profiler = Profiler()
+    code = self.code
+    clock = profiler.clock
+    while not self.terminate:
+      ip = self.ip
+      if self.trace_output:
+        print(f"{ip:04}: {self.program[ip].rstrip()}")
+      profiler.sync(self.frames)
+      start = clock()
+      code[ip]()
+      profiler.record(ip, clock() - start)
 
   def _blank_line(self):
     self._advance_to_next_statement()
 
-  def _var(self, tokens):
-    for variable in tokens[1:]:
+  def _var(self, type, names):
+    for variable in names:
       if self.env_manager.get(variable) != None and self.env_manager.highest(variable) == self.level:
         super().error(ErrorType.NAME_ERROR,"duplicate declaration", self.ip)
-      type = tokens[0]
-      if type == "int":
-        self._declare(variable, Value(Type.INT, 0),self.level)
-      elif type == "string":
-        self._declare(variable, Value(Type.STRING, ""),self.level)
-      elif type == "bool":
-        self._declare(variable, Value(Type.BOOL, False),self.level)
-      else:
+      if type not in Interpreter.VAR_TYPES:
         super().error(ErrorType.TYPE_ERROR, "", self.ip)
+      self._declare(variable, Interpreter.DEFAULT_VALUES[Interpreter.VAR_TYPES[type]],self.level)
     self._advance_to_next_statement()
 
   def _declare(self,variable, val, level):
@@ -108,135 +293,142 @@ class Interpreter(InterpreterBase):
       super().error(ErrorType.TYPE_ERROR, "Unknown type", self.ip)
 
 
-  def _assign(self, tokens):
-   if len(tokens) < 2:
-     super().error(ErrorType.SYNTAX_ERROR,"Invalid assignment statement")
-   vname = tokens[0]
+  # result variables live in the top-level scope of the current function
+  def _declare_result(self, result_name, value):
+    self._declare(result_name, value, self.frames[-1].level)
+
+  def _assign(self, vname, expression):
    var = self.env_manager.get(vname)
    if var == None:
      super().error(ErrorType.NAME_ERROR, "No val", self.ip)
    type = var.type()
-   value_type = self._eval_expression(tokens[1:])
+   value_type = expression()
    # a can be assigned to 1
    if type != value_type.type():
      super().error(ErrorType.TYPE_ERROR, "", self.ip)
 
-   self._set_value(tokens[0], value_type)
+   self._set_value(vname, value_type)
    self._advance_to_next_statement()
 
-  def _funccall(self, args):
-    if not args:
-      super().error(ErrorType.SYNTAX_ERROR,"Missing function name to call", self.ip) #!
-    if args[0] == InterpreterBase.PRINT_DEF:
-      self._print(args[1:])
-      self._advance_to_next_statement()
-    elif args[0] == InterpreterBase.INPUT_DEF:
-      self._input(args[1:])
-      self._advance_to_next_statement()
-    elif args[0] == InterpreterBase.STRTOINT_DEF:
-      self._strtoint(args[1:])
-      self._advance_to_next_statement()
-    else:
-      name = args[0]
-      self.return_stack.append(self.ip+1)
-      self.map.append(self.env_manager)
-      self.levels.append(self.level)
-      func_info = self.func_manager.get_function_info(args[0])
-      if func_info is None:
-        super().error(ErrorType.NAME_ERROR, "no func", self.ip)
-      self.params = func_info.params
-      if self.params == {}:
-        self.env_manager = EnvironmentManager()
-        if len(self.params) != len(args[1:]): super().error(ErrorType.NAME_ERROR, "", self.ip)
+  # _assign for an expression that's known to have the variable's type
+  def _assign_typed(self, vname, expression):
+   if self.env_manager.get(vname) == None:
+     super().error(ErrorType.NAME_ERROR, "No val", self.ip)
+   self._set_value(vname, expression())
+   self._advance_to_next_statement()
+
+  # calls a user-defined function; args are the argument tokens and operands their compiled forms
+  def _funccall(self, func_info, args, operands):
+    values = self._bind_arguments(func_info, args, operands)
+    if self.max_depth is not None and len(self.frames) >= self.max_depth:
+      super().error(ErrorType.RESOURCE_ERROR, f"Maximum call depth of {self.max_depth} exceeded", self.ip)
+    frame = Frame(func_info, self.ip+1, self.env_manager, self.level)
+    for (param, type, by_ref), vname in zip(func_info.params, args):
+      if by_ref:
+        frame.refs.append((vname, param, None))
+    self._enter(frame, values)
+    self.frames.append(frame)
+    if self.memory is not None:
+      self.memory.called(len(self.frames))
+
+  # a funccall whose next statement ends the calling function (its endfunc, or a bare return when
+  # returns is set): the callee takes over the caller's frame instead of stacking a new one, so
+  # recursion in tail position runs in constant space. The caller's by-ref write-backs are settled
+  # now, or handed on to the callee's by-ref parameters they were passed to, and the caller's
+  # caller gets whatever result it would have got from the caller itself.
+  def _tail_funccall(self, func_info, args, operands, returns):
+    if len(self.frames) == 1:
+      return self._funccall(func_info, args, operands)  # main's endfunc ends the program
+    values = self._bind_arguments(func_info, args, operands)
+    caller = self.frames[-1]
+    frame = Frame(func_info, caller.return_ip, caller.env_manager, caller.level)
+    frame.tail = True
+    if caller.tail:
+      frame.tail_result = caller.tail_result
+    elif returns and caller.func_info.return_type is not None:
+      frame.tail_result = (caller.func_info.result_name, Interpreter.DEFAULT_VALUES[caller.func_info.return_type])
+    passed_by_ref = {}  # caller variable -> last by-ref parameter it was passed to
+    for (param, type, by_ref), vname in zip(func_info.params, args):
+      if by_ref:
+        passed_by_ref[vname] = param
+    for vname, param, value in caller.refs:
+      if param is None:
+        frame.refs.append((vname, None, value))
+      elif param in passed_by_ref:
+        frame.refs.append((vname, passed_by_ref[param], None))
       else:
-        args = args[1:]
-        if len(self.params) != len(set(self.params)): super().error(ErrorType.NAME_ERROR, "duplicates", self.ip)
-        if len(self.params) != len(args): super().error(ErrorType.NAME_ERROR, "not of same len", self.ip)
-        for num, (param, type) in enumerate(self.params.items()):
-          vname = args[num]
-          var = self.env_manager.get(vname)
-          if var != None:
-            arg_type = var.type()
-            if isinstance(type,str) and type[:3] == "ref":
-              type = type[3:]
-              if (type == "resultb" and Type.BOOL != arg_type) or (type == "results" and Type.STRING != arg_type) or (type == "resulti" and Type.INT != arg_type) or (type == "int" and Type.INT != arg_type) or (type == "string" and Type.STRING != arg_type) or (type == "bool" and Type.BOOL != arg_type):
-                super().error(ErrorType.TYPE_ERROR, "", self.ip)
-            else:
-              if type != arg_type:
-                super().error(ErrorType.TYPE_ERROR, "does not match", self.ip)
-        self.env_manager = EnvironmentManager()
-        self._create_parm_mapping(self.params, args)
-      self.functions.append(name)
-      self.ip = self._find_first_instruction(name)
-
-  def _create_parm_mapping(self, params, args):
-    for num, (param, type) in enumerate(params.items()):
-      vname = args[num]
-      if isinstance(type,str) and type[:3] == "ref":
-        self.updates[vname] = param
-      old_map = self.map[-1]
-      var = old_map.get(vname)
+        frame.refs.append((vname, None, self.env_manager.get(param)))
+    self.level = caller.level
+    if self.memory is not None:
+      self.memory.dropped(self.env_manager, len(self.frames))
+    self._enter(frame, values)
+    self.frames[-1] = frame
+
+  # checks a call's arguments and returns their values
+  def _bind_arguments(self, func_info, args, operands):
+    if func_info.duplicate_params: super().error(ErrorType.NAME_ERROR, "duplicates", self.ip)
+    if len(func_info.params) != len(args): super().error(ErrorType.NAME_ERROR, "not of same len", self.ip)
+    values = []
+    for (param, type, by_ref), vname in zip(func_info.params, args):
+      var = self.env_manager.get(vname)
+      if var != None and var.type() != type:
+        super().error(ErrorType.TYPE_ERROR, "does not match", self.ip)
+      values.append(var)
+    for num, var in enumerate(values):
       if var == None:
-        var = self._get_value(vname)
-      self._declare(param,var,self.level)
+        values[num] = operands[num]()  # a literal, or NAME_ERROR for an unknown variable
+    return values
+
+  # starts running frame's function in a fresh environment holding its parameters
+  def _enter(self, frame, values):
+    self.env_manager = self.env_manager_class()
+    for (param, type, by_ref), var in zip(frame.func_info.params, values):
+      self.env_manager.declare(param, var, self.level)
+    self.ip = frame.func_info.start_ip
 
   def _endfunc(self):
-    if not self.return_stack:  # done with main!
+    if len(self.frames) == 1:  # done with main!
       self.terminate = True
     else:
-      #TODO
-
-      if self.updates != {}:
-        for num, (key,val) in enumerate(self.updates.items()):
-          if isinstance(val,Value):
-            continue
-          self.updates[key] = self.env_manager.get(val)
-
-      self.env_manager.delete(self.level)
-      self.level = self.levels.pop()
-      self.env_manager = self.map.pop()
-
-      #set here
-      if self.updates != {}:
-        for num, (key,val) in enumerate(self.updates.items()):
-          self._set_value(key,val)
-
-      funcname = self.functions[-1]
-      func_info_return_type = self.func_manager.get_function_info(funcname).return_val
-      if (self.tokenized_program[self.ip - 1][0] == "func" and func_info_return_type is not None) and (
+      frame = self.frames.pop()
+      ref_values = [(vname, value if param is None else self.env_manager.get(param))
+                    for vname, param, value in frame.refs]
+      if self.memory is not None:
+        self.memory.dropped(self.env_manager, len(self.frames))
+      self.level = frame.level
+      self.env_manager = frame.env_manager
+      for vname, value in ref_values:
+        self._set_value(vname, value)
+
+      func_info = frame.func_info
+      if frame.tail:
+        if frame.tail_result is not None:
+          self._declare_result(*frame.tail_result)
+      # a function with an empty body still hands back a default result
+      elif (func_info.return_type is not None and self.ip == func_info.start_ip) and (
               len(self.tokenized_program[self.ip]) == 1):
+        self._declare_result(func_info.result_name, Interpreter.DEFAULT_VALUES[func_info.return_type])
 
-        if func_info_return_type[1] == Type.BOOL:
-          self._declare("resultb", Value(Type.BOOL, False), self.level)
-        elif func_info_return_type[1] == Type.STRING:
-          self._declare("results", Value(Type.STRING, ""), self.level)
-        elif func_info_return_type[1] == Type.INT:
-          self._declare("resulti", Value(Type.INT, 0), self.level)
-
-      self.functions.pop()
-      self.ip = self.return_stack.pop()
+      self.ip = frame.return_ip
 
-  def _if(self, args):
-    if not args:
-      super().error(ErrorType.SYNTAX_ERROR,"Invalid if syntax", self.ip) #no
-    value_type = self._eval_expression(args)
+  def _if(self, expression):
+    value_type = expression()
     if value_type.type() != Type.BOOL:
       super().error(ErrorType.TYPE_ERROR,"Non-boolean if expression", self.ip) #!
+    self._if_bool(value_type)
+
+  # the rest of _if, for a value that's known to be a bool (see Compiler.typed)
+  def _if_bool(self, value_type):
     if value_type.value():
-      self.levels.append(self.level)
       self.level += 1
       self._advance_to_next_statement()
       return
-    else:
-      for line_num in range(self.ip+1, len(self.tokenized_program)):
-        tokens = self.tokenized_program[line_num]
-        if not tokens:
-          continue
-        if (tokens[0] == InterpreterBase.ENDIF_DEF or tokens[0] == InterpreterBase.ELSE_DEF) and self.indents[self.ip] == self.indents[line_num]:
-          self.ip = line_num + 1
-          self.level += 1
-          return
-    super().error(ErrorType.SYNTAX_ERROR,"Missing endif", self.ip) #no
+    target = self.jumps[self.ip]
+    if target is None:
+      super().error(ErrorType.SYNTAX_ERROR,"Missing endif", self.ip) #no
+    self.ip = target + 1
+    if self.tokenized_program[target][0] == InterpreterBase.ELSE_DEF:
+      self.level += 1  # the else body runs in its own scope, closed by the endif
 
   def _endif(self):
     self.env_manager.delete(self.level)
@@ -244,61 +436,34 @@ class Interpreter(InterpreterBase):
     self._advance_to_next_statement()
 
   def _else(self):
-    for line_num in range(self.ip+1, len(self.tokenized_program)):
-      tokens = self.tokenized_program[line_num]
-      if not tokens:
-        continue
-      if tokens[0] == InterpreterBase.ENDIF_DEF and self.indents[self.ip] == self.indents[line_num]:
-          self.env_manager.delete(self.level)
-          self.level -= 1
-          self.ip = line_num + 1
-          return
-    super().error(ErrorType.SYNTAX_ERROR,"Missing endif", self.ip) #no
-
-  def _return(self,args):
-    funcname = self.functions[-1]
-    func_info_return_type = self.func_manager.get_function_info(funcname).return_val
-    if args and func_info_return_type is None:
-      super().error(ErrorType.TYPE_ERROR,"Non-valid return type", self.ip) #!
-    if not args:
-      self._endfunc()
-      if func_info_return_type[1] == Type.BOOL:
-          self._declare("resultb", Value(Type.BOOL, False), self.level)
-      elif func_info_return_type[1] == Type.STRING:
-          self._declare("results", Value(Type.STRING, ""), self.level)
-      elif func_info_return_type[1] == Type.INT:
-          self._declare("resulti", Value(Type.INT,0), self.level)
-
-      return
-
-    value_type = self._eval_expression(args)
+    target = self.jumps[self.ip]
+    if target is None:
+      super().error(ErrorType.SYNTAX_ERROR,"Missing endif", self.ip) #no
+    self.env_manager.delete(self.level)
+    self.level -= 1
+    self.ip = target + 1
 
-    if func_info_return_type[1] != value_type.type():
-      super().error(ErrorType.TYPE_ERROR,"Non-valid return type", self.ip) #!
+  def _return(self,expression):
+    frame = self.frames[-1]
+    func_info = frame.func_info
+    if not expression:
+      value_type = None if func_info.return_type is None else Interpreter.DEFAULT_VALUES[func_info.return_type]
+    else:
+      value_type = expression()
+      if func_info.return_type != value_type.type():
+        super().error(ErrorType.TYPE_ERROR,"Non-valid return type", self.ip) #!
     self._endfunc()
-    if func_info_return_type[1] == Type.BOOL:
-      if self.levels != []:
-        self._declare("resultb", value_type,self.levels[-1])
-      else:
-        self._declare("resultb", value_type, self.level)
-    elif func_info_return_type[1] == Type.STRING:
-      if self.levels != []:
-        self._declare("results", value_type,self.levels[-1])
-      else:
-        self._declare("results", value_type, self.level)
-    elif func_info_return_type[1] == Type.INT:
-      if self.levels != []:
-        self._declare("resulti", value_type,self.levels[-1])
-      else:
-        self._declare("resulti", value_type, self.level)
-
+    if value_type is not None and not frame.tail:  # a tail frame's _endfunc settled the result
+      self._declare_result(func_info.result_name, value_type)
 
-  def _while(self, args):
-    if not args:
-      super().error(ErrorType.SYNTAX_ERROR,"Missing while expression", self.ip) #no
-    value_type = self._eval_expression(args)
+  def _while(self, expression):
+    value_type = expression()
     if value_type.type() != Type.BOOL:
       super().error(ErrorType.TYPE_ERROR,"Non-boolean while expression", self.ip) #!
+    self._while_bool(value_type)
+
+  # the rest of _while, for a value that's known to be a bool
+  def _while_bool(self, value_type):
     if value_type.value() == False:
       self._exit_while()
       return
@@ -309,102 +474,52 @@ class Interpreter(InterpreterBase):
     self._advance_to_next_statement()
 
   def _exit_while(self):
-    while_indent = self.indents[self.ip]
-    cur_line = self.ip + 1
-    while cur_line < len(self.tokenized_program):
-      if self.tokenized_program[cur_line][0] == InterpreterBase.ENDWHILE_DEF and self.indents[cur_line] == while_indent:
-        self.ip = cur_line + 1
-        return
-      if self.tokenized_program[cur_line] and self.indents[cur_line] < self.indents[self.ip]:
-        break # syntax error!
-      cur_line += 1
-    # didn't find endwhile
-    super().error(ErrorType.SYNTAX_ERROR,"Missing endwhile", self.ip) #no
-
-  def _endwhile(self, args):
-    while_indent = self.indents[self.ip]
-    cur_line = self.ip - 1
-    while cur_line >= 0:
-      if self.tokenized_program[cur_line][0] == InterpreterBase.WHILE_DEF and self.indents[cur_line] == while_indent:
-        self.ip = cur_line
-        self.env_manager.delete(self.level)
-        self.level -=1
-        return
-      if self.tokenized_program[cur_line] and self.indents[cur_line] < self.indents[self.ip]:
-        break # syntax error!
-      cur_line -= 1
-    # didn't find while
-    super().error(ErrorType.SYNTAX_ERROR,"Missing while", self.ip) #no
-
-  def _print(self, args):
-    if not args:
+    target = self.jumps[self.ip]
+    if target is None:
+      super().error(ErrorType.SYNTAX_ERROR,"Missing endwhile", self.ip) #no
+    self.ip = target + 1
+
+  def _endwhile(self):
+    target = self.jumps[self.ip]
+    if target is None:
+      super().error(ErrorType.SYNTAX_ERROR,"Missing while", self.ip) #no
+    self.ip = target
+    self.env_manager.delete(self.level)
+    self.level -=1
+
+  # the builtins below take their arguments as compiled operands (see Compiler.compile_operand)
+  def output(self, v):
+    if self.memory is not None:
+      self.memory.wrote(v)
+    super().output(v)
+
+  def _print(self, operands):
+    if not operands:
       super().error(ErrorType.SYNTAX_ERROR,"Invalid print call syntax", self.ip) #no
     out = []
-    for arg in args:
-      val_type = self._get_value(arg)
+    for operand in operands:
+      val_type = operand()
       out.append(str(val_type.value()))
-    super().output(''.join(out))
+    self.output(''.join(out))
 
-  def _input(self, args):
-    if args:
-      self._print(args)
+  def _input(self, operands):
+    if operands:
+      self._print(operands)
     result = super().get_input()
-    if self.levels != []:
-      self._declare("results", Value(Type.STRING, result), self.levels[-1])
-    else:
-      self._declare("results", Value(Type.STRING, result),self.level)
+    self._declare_result("results", Value(Type.STRING, result))
 
-  def _strtoint(self, args):
-    if len(args) != 1:
+  def _strtoint(self, operands):
+    if len(operands) != 1:
       super().error(ErrorType.SYNTAX_ERROR,"Invalid strtoint call syntax", self.ip) #no
-    value_type = self._get_value(args[0])
+    value_type = operands[0]()
     if value_type.type() != Type.STRING:
       super().error(ErrorType.TYPE_ERROR,"Non-string passed to strtoint", self.ip) #!
-    if self.levels != []:
-      self._declare("resulti", Value(Type.INT, int(value_type.value())),self.levels[-1])   # return always passed back in result
-    else:
-      self._declare("resulti", Value(Type.INT, int(value_type.value())),self.level)   # return always passed back in result
+    self._declare_result("resulti", int_value(int(value_type.value())))   # return always passed back in result
 
   def _advance_to_next_statement(self):
     # for now just increment IP, but later deal with loops, returns, end of functions, etc.
     self.ip += 1
 
-  # create a lookup table of code to run for different operators on different types
-  def _setup_operations(self):
-    self.binary_op_list = ['+','-','*','/','%','==','!=', '<', '<=', '>', '>=', '&', '|']
-    self.binary_ops = {}
-    self.binary_ops[Type.INT] = {
-     '+': lambda a,b: Value(Type.INT, a.value()+b.value()),
-     '-': lambda a,b: Value(Type.INT, a.value()-b.value()),
-     '*': lambda a,b: Value(Type.INT, a.value()*b.value()),
-     '/': lambda a,b: Value(Type.INT, a.value()//b.value()),  # // for integer ops
-     '%': lambda a,b: Value(Type.INT, a.value()%b.value()),
-     '==': lambda a,b: Value(Type.BOOL, a.value()==b.value()),
-     '!=': lambda a,b: Value(Type.BOOL, a.value()!=b.value()),
-     '>': lambda a,b: Value(Type.BOOL, a.value()>b.value()),
-     '<': lambda a,b: Value(Type.BOOL, a.value()<b.value()),
-     '>=': lambda a,b: Value(Type.BOOL, a.value()>=b.value()),
-     '<=': lambda a,b: Value(Type.BOOL, a.value()<=b.value()),
-    }
-    self.binary_ops[Type.STRING] = {
-     '+': lambda a,b: Value(Type.STRING, a.value()+b.value()),
-     '==': lambda a,b: Value(Type.BOOL, a.value()==b.value()),
-     '!=': lambda a,b: Value(Type.BOOL, a.value()!=b.value()),
-     '>': lambda a,b: Value(Type.BOOL, a.value()>b.value()),
-     '<': lambda a,b: Value(Type.BOOL, a.value()<b.value()),
-     '>=': lambda a,b: Value(Type.BOOL, a.value()>=b.value()),
-     '<=': lambda a,b: Value(Type.BOOL, a.value()<=b.value()),
-    }
-    self.binary_ops[Type.BOOL] = {
-     '&': lambda a,b: Value(Type.BOOL, a.value() and b.value()),
-     '==': lambda a,b: Value(Type.BOOL, a.value()==b.value()),
-     '!=': lambda a,b: Value(Type.BOOL, a.value()!=b.value()),
-     '|': lambda a,b: Value(Type.BOOL, a.value() or b.value())
-    }
-
-  def _compute_indentation(self, program):
-    self.indents = [len(line) - len(line.lstrip(' ')) for line in program]
-
   def _find_first_instruction(self, funcname):
     func_info = self.func_manager.get_function_info(funcname)
     if func_info == None:
@@ -415,17 +530,24 @@ class Interpreter(InterpreterBase):
   def _get_value(self, token):
     if not token:
       super().error(ErrorType.NAME_ERROR,f"Empty token", self.ip) #no
-    if token[0] == '"':
-      return Value(Type.STRING, token.strip('"'))
-    if token.isdigit() or token[0] == '-':
-      return Value(Type.INT, int(token))
-    if token == InterpreterBase.TRUE_DEF or token == InterpreterBase.FALSE_DEF:
-      return Value(Type.BOOL, token == InterpreterBase.TRUE_DEF)
+    value = self._parse_literal(token)
+    if value is not None:
+      return value
     value = self.env_manager.get(token)
     if value  == None:
       super().error(ErrorType.NAME_ERROR,f"Unknown variable {token}", self.ip) #!
     return value
 
+  # given a literal token (e.g., 17, True, "foo"), give us its Value, or None for a variable name
+  def _parse_literal(self, token):
+    if token[0] == '"':
+      return Value(Type.STRING, token.strip('"'))
+    if token.isdigit() or token[0] == '-':
+      return int_value(int(token))
+    if token == InterpreterBase.TRUE_DEF or token == InterpreterBase.FALSE_DEF:
+      return bool_value(token == InterpreterBase.TRUE_DEF)
+    return None
+
   # given a variable name and a Value object, associate the name with the value
   def _set_value(self, varname, value_type):
     self.env_manager.set(varname,value_type)
@@ -449,7 +571,7 @@ class Interpreter(InterpreterBase):
         v1 = stack.pop()
         if v1.type() != Type.BOOL:
           super().error(ErrorType.TYPE_ERROR,f"Expecting boolean for ! {v1.type()}", self.ip) #!
-        stack.append(Value(Type.BOOL, not v1.value()))
+        stack.append(FALSE if v1.value() else TRUE)
       else:
         value_type = self._get_value(token)
         stack.append(value_type)
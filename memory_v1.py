@@ -0,0 +1,103 @@
+from type import Type
+from env_v1 import ScopedEnvironmentManager
+
+# Raised by a MemoryMeter when a run goes over one of its caps; the interpreter turns it into a
+# RESOURCE_ERROR on the line that was running
+class MemoryLimitExceeded(Exception):
+  pass
+
+# MemoryMeter keeps a running account of what one interpreter run is holding on to, and after the
+# run it's left in Interpreter.memory as that run's stats:
+#   variables     - live variable bindings, in every scope of every active call
+#   string_bytes  - characters of string held by those bindings (a string bound to two variables
+#                   counts twice, as it would once either one is changed)
+#   depth         - active calls, main's included
+#   output_lines, output_bytes - what the program has printed so far, newlines included
+# Each of the first three also has a peak_ twin. Any of max_variables, max_string_bytes and
+# max_output_bytes that's set is a cap; going over it ends the run with a RESOURCE_ERROR (for call
+# depth, see the interpreter's max_depth). Only a metered run pays for any of this.
+class MemoryMeter:
+  def __init__(self, max_variables=None, max_string_bytes=None, max_output_bytes=None):
+    self.max_variables = max_variables
+    self.max_string_bytes = max_string_bytes
+    self.max_output_bytes = max_output_bytes
+    self.reset()
+
+  def reset(self):
+    self.variables = self.peak_variables = 0
+    self.string_bytes = self.peak_string_bytes = 0
+    self.depth = self.peak_depth = 0
+    self.output_lines = self.output_bytes = 0
+
+  # a binding to value was made
+  def remember(self, value):
+    self.variables += 1
+    if self.variables > self.peak_variables:
+      self.peak_variables = self.variables
+      if self.max_variables is not None and self.variables > self.max_variables:
+        raise MemoryLimitExceeded(f'More than {self.max_variables} live variables')
+    if value.type() == Type.STRING:
+      self.string_bytes += value.length()
+      if self.string_bytes > self.peak_string_bytes:
+        self.peak_string_bytes = self.string_bytes
+        if self.max_string_bytes is not None and self.string_bytes > self.max_string_bytes:
+          raise MemoryLimitExceeded(f'More than {self.max_string_bytes} bytes of strings held')
+
+  # a binding to value is gone
+  def forget(self, value):
+    self.variables -= 1
+    if value.type() == Type.STRING:
+      self.string_bytes -= value.length()
+
+  def called(self, depth):
+    self.depth = depth
+    if depth > self.peak_depth:
+      self.peak_depth = depth
+
+  # a call returned (or was replaced by a tail call) and env, its environment, is dropped
+  def dropped(self, env, depth):
+    for bindings in env.environment.values():
+      for level, value in bindings:
+        self.forget(value)
+    self.depth = depth
+
+  def wrote(self, line):
+    self.output_lines += 1
+    self.output_bytes += len(line) + 1
+    if self.max_output_bytes is not None and self.output_bytes > self.max_output_bytes:
+      raise MemoryLimitExceeded(f'More than {self.max_output_bytes} bytes of output')
+
+  def report(self):
+    return (f'variables {self.variables} (peak {self.peak_variables}), '
+            f'string bytes {self.string_bytes} (peak {self.peak_string_bytes}), '
+            f'call depth peak {self.peak_depth}, output {self.output_lines} lines / {self.output_bytes} bytes')
+
+# A ScopedEnvironmentManager that tells a MemoryMeter about every binding it makes, replaces and
+# deletes; the interpreter uses it instead of its env_manager_class when it has a meter
+class MeteredEnvironmentManager(ScopedEnvironmentManager):
+  def __init__(self, meter):
+    super().__init__()
+    self.meter = meter
+
+  def delete(self,lvl):
+    for level, symbols in self.scopes.items():
+      if level >= lvl:
+        for symbol in symbols:
+          for binding in self.environment.get(symbol, ()):
+            if binding[0] == level:
+              self.meter.forget(binding[1])
+    super().delete(lvl)
+
+  def declare(self, symbol, value,level):
+    for binding in self.environment.get(symbol, ()):
+      if binding[0] == level:
+        self.meter.forget(binding[1])  # redeclared in place, e.g. a result variable
+    self.meter.remember(value)
+    super().declare(symbol, value, level)
+
+  def set(self,symbol, value,):
+    bindings = self.environment.get(symbol)
+    if bindings is not None:
+      self.meter.forget(bindings[-1][1])
+      self.meter.remember(value)
+    super().set(symbol, value)
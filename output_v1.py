@@ -0,0 +1,72 @@
+import sys
+
+# Output sinks decide what happens to each line a Brewin program prints. InterpreterBase.output
+# hands every line to its sink and get_output returns whatever the sink kept.
+#   ConsoleSink   - print each line and keep a log of it (the default)
+#   CaptureSink   - only keep the log, nothing is printed (what the tests use)
+#   BufferedSink  - write to a stream in large chunks, keep nothing
+#   StreamingSink - write each line straight to a stream, keep nothing
+# The interpreter flushes its sink when a run ends, before raising an error and before reading
+# input, so buffered output always shows up before a prompt or an error message.
+class CaptureSink:
+  def __init__(self):
+    self.log = []
+
+  def write(self, line):
+    self.log.append(line)
+
+  def flush(self):
+    pass
+
+  def reset(self):
+    self.log = []
+
+  def get_output(self):
+    return self.log
+
+class ConsoleSink(CaptureSink):
+  def write(self, line):
+    print(line)
+    self.log.append(line)
+
+# stream defaults to whatever sys.stdout is when output is written, so redirection still works
+class StreamingSink:
+  def __init__(self, stream=None):
+    self.stream = stream
+
+  def write(self, line):
+    (self.stream or sys.stdout).write(f'{line}\n')
+
+  def flush(self):
+    (self.stream or sys.stdout).flush()
+
+  def reset(self):
+    pass
+
+  def get_output(self):
+    return []
+
+class BufferedSink(StreamingSink):
+  def __init__(self, stream=None, buffer_size=1 << 16):
+    super().__init__(stream)
+    self.buffer_size = buffer_size  # characters to collect before writing them out
+    self.buffer = []
+    self.buffered = 0
+
+  def write(self, line):
+    line = f'{line}\n'
+    self.buffer.append(line)
+    self.buffered += len(line)
+    if self.buffered >= self.buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.buffer:
+      (self.stream or sys.stdout).write(''.join(self.buffer))
+      self.buffer = []
+      self.buffered = 0
+    super().flush()
+
+  def reset(self):
+    self.buffer = []
+    self.buffered = 0
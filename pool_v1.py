@@ -0,0 +1,78 @@
+import collections
+import multiprocessing
+import multiprocessing.connection
+import time
+
+# A pool of worker processes for jobs that each get a time limit. Every worker calls
+# setup(*setup_args) once and then runs job after job with the function that returns, so whatever
+# setup loads (the interpreter module, a test scaffold) is loaded once per worker. A job that runs
+# past its deadline has its worker killed, and one whose worker dies is reported as crashed;
+# either way a fresh worker takes the slot if there's still work for it, so a runaway job only
+# ever costs its own slot. Used by harness.run_tests_in_pool and batch.run_batch.
+
+# worker process loop: run(index, job) for each job sent down conn, sending back what it returns
+def _worker(setup, setup_args, conn):
+  run = setup(*setup_args)
+  while True:
+    job = conn.recv()
+    if job is None:
+      return
+    conn.send(run(*job))
+
+def _start_worker(setup, setup_args):
+  conn, child_conn = multiprocessing.Pipe()
+  process = multiprocessing.Process(target=_worker, args=(setup, setup_args, child_conn), daemon=True)
+  process.start()
+  child_conn.close()
+  return conn, process
+
+# Runs jobs on up to workers processes, yielding (index, status, result) for each one as it
+# finishes, in whatever order they finish. status is 'ok' with whatever run returned, 'timeout'
+# if the job took longer than time_limit seconds, or 'crash' with the dead worker's exit code.
+# Stopping the iteration early kills whatever is still running.
+def run_pool(jobs, setup, setup_args=(), workers=1, time_limit=10):
+  pending = collections.deque(enumerate(jobs))
+  idle = [_start_worker(setup, setup_args) for _ in range(min(workers, len(pending)))]
+  busy = {}  # conn -> (process, index, deadline)
+
+  def replace_worker():
+    if pending:
+      idle.append(_start_worker(setup, setup_args))
+
+  try:
+    while pending or busy:
+      while idle and pending:
+        conn, process = idle.pop()
+        index, job = pending.popleft()
+        conn.send((index, job))
+        busy[conn] = (process, index, time.monotonic() + time_limit)
+
+      wait_for = max(0, min(deadline for _, _, deadline in busy.values()) - time.monotonic())
+      for conn in multiprocessing.connection.wait(list(busy), wait_for):
+        process, index, _ = busy.pop(conn)
+        try:
+          result = conn.recv()
+          idle.append((conn, process))
+          yield index, 'ok', result
+        except EOFError:
+          process.join()
+          conn.close()
+          replace_worker()
+          yield index, 'crash', process.exitcode
+
+      now = time.monotonic()
+      for conn, (process, index, deadline) in list(busy.items()):
+        if deadline <= now:
+          process.kill()
+          process.join()
+          conn.close()
+          del busy[conn]
+          replace_worker()
+          yield index, 'timeout', None
+  finally:
+    for conn, process in idle:
+      conn.send(None)
+      process.join()
+    for conn, (process, _, _) in busy.items():
+      process.kill()
+      process.join()
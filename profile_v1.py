@@ -0,0 +1,68 @@
+import time
+
+# Profiler collects, for one interpreter run, how many times each source line executed and how
+# long it took, plus the same time rolled up per Brewin function and per call stack. Only the
+# interpreter's profiling run loop talks to it, so an unprofiled run pays nothing.
+# Times are in nanoseconds and are "self" times: a funccall line is charged for setting up the
+# call, and the callee's lines are charged to the callee.
+class Profiler:
+  def __init__(self):
+    self.line_counts = {}     # line number -> executions
+    self.line_times = {}      # line number -> total ns
+    self.line_functions = {}  # line number -> name of the function it belongs to
+    self.function_calls = {}  # function name -> times it was entered
+    self.function_times = {} # function name -> total ns spent on its lines
+    self.stack_times = {}     # "main;foo;bar" -> total ns spent with that call stack
+    self._keys = []           # collapsed stack for each depth of the current call stack
+    self._top = None
+    self.clock = time.perf_counter_ns
+
+  # called before each line with the interpreter's frames, to notice calls and returns
+  def sync(self, frames):
+    top = frames[-1]
+    if top is self._top:
+      return
+    depth = len(frames)
+    name = top.func_info.name
+    if depth >= len(self._keys):
+      del self._keys[depth - 1:]  # a call, or a frame replaced in place
+      self._keys.append(name if depth == 1 else self._keys[-1] + ';' + name)
+      self.function_calls[name] = self.function_calls.get(name, 0) + 1
+    else:
+      del self._keys[depth:]  # a return
+    self._top = top
+    self._name = name
+
+  def record(self, line_num, elapsed):
+    self.line_counts[line_num] = self.line_counts.get(line_num, 0) + 1
+    self.line_times[line_num] = self.line_times.get(line_num, 0) + elapsed
+    self.line_functions[line_num] = self._name
+    self.function_times[self._name] = self.function_times.get(self._name, 0) + elapsed
+    key = self._keys[-1]
+    self.stack_times[key] = self.stack_times.get(key, 0) + elapsed
+
+  # the limit most expensive lines as (line number, executions, total ns), slowest first
+  def hot_lines(self, limit=None):
+    lines = sorted(self.line_times, key=lambda line_num: self.line_times[line_num], reverse=True)
+    return [(line_num, self.line_counts[line_num], self.line_times[line_num]) for line_num in lines[:limit]]
+
+  # a human readable hot-line and per-function report; program is the source, for line text
+  def report(self, program, limit=20):
+    total = sum(self.line_times.values()) or 1
+    out = ['   line      count     total ms       ns/exec      %  source']
+    for line_num, count, elapsed in self.hot_lines(limit):
+      source = program[line_num].strip() if line_num < len(program) else ''
+      out.append(f'{line_num:7} {count:10} {elapsed / 1e6:12.3f} {elapsed / count:13.0f} {100 * elapsed / total:6.1f}  {source}')
+    out.append('')
+    out.append('function                  calls     total ms      %')
+    for name in sorted(self.function_times, key=lambda name: self.function_times[name], reverse=True):
+      elapsed = self.function_times[name]
+      out.append(f'{name:<20} {self.function_calls.get(name, 0):10} {elapsed / 1e6:12.3f} {100 * elapsed / total:6.1f}')
+    return '\n'.join(out)
+
+  # collapsed stacks ("main;foo;bar 1234" per line, weights in microseconds), the input format
+  # of flamegraph.pl and speedscope
+  def write_collapsed(self, path):
+    with open(path, 'w') as handle:
+      for key, elapsed in sorted(self.stack_times.items()):
+        handle.write(f'{key} {max(1, elapsed // 1000)}\n')
@@ -0,0 +1,295 @@
+import os
+import tempfile
+import unittest
+
+import interpreterv2
+from cache_v1 import ProgramCache
+from input_v1 import StreamSource, MmapSource
+from memory_v1 import MemoryMeter
+from type import Type
+from value import Value, int_value, bool_value
+
+# Checks of the interpreter's Python-level features (profiling, limits, builtins, ...) that the
+# .src/.exp suites run by tester.py can't reach:
+#
+#   $ python3 -m unittest test_interpreterv2
+
+def program(text):
+  return text.split('\n')
+
+def read_lines(path):
+  with open(path) as handle:
+    return handle.readlines()
+
+class ProfilerTest(unittest.TestCase):
+  # fact recurses normally; even and odd call each other in tail position, so each call
+  # replaces the caller's frame at the same depth
+  PROGRAM = program('''func main void
+  funccall fact 3
+  funccall print resulti
+  funccall even 3
+  funccall print resultb
+endfunc
+func fact n:int int
+  if <= n 1
+    return 1
+  endif
+  var int m
+  assign m - n 1
+  funccall fact m
+  return * n resulti
+endfunc
+func even n:int bool
+  if == n 0
+    return True
+  endif
+  var int m
+  assign m - n 1
+  funccall odd m
+  return
+endfunc
+func odd n:int bool
+  if == n 0
+    return False
+  endif
+  var int m
+  assign m - n 1
+  funccall even m
+endfunc''')
+
+  def test_counts_and_stacks(self):
+    interpreter = interpreterv2.Interpreter(False, profile=True)
+    interpreter.run(ProfilerTest.PROGRAM)
+    self.assertEqual(interpreter.get_output(), ['6', 'False'])
+    profiler = interpreter.profiler
+    self.assertEqual(profiler.line_counts[7], 3)   # if <= n 1, once per fact call
+    self.assertEqual(profiler.line_counts[13], 2)  # return * n resulti
+    self.assertEqual(profiler.line_counts[30], 1)  # odd's funccall even, in tail position
+    self.assertEqual(profiler.function_calls, {'main': 1, 'fact': 3, 'even': 2, 'odd': 2})
+    # a tail call replaces its caller's stack entry instead of nesting under it
+    self.assertEqual(sorted(profiler.stack_times),
+                     ['main', 'main;even', 'main;fact', 'main;fact;fact', 'main;fact;fact;fact', 'main;odd'])
+    self.assertEqual(set(profiler.line_functions.values()), {'main', 'fact', 'even', 'odd'})
+
+class RerunTest(unittest.TestCase):
+  # a loaded program runs the same way every time it's executed, reading its input from the
+  # start again; testsv2/test16 reads a number from testsv2/test16.in
+  def test_execute_twice(self):
+    expected = [line.rstrip('\n') for line in read_lines('testsv2/test16.exp')]
+    for source in [StreamSource('testsv2/test16.in'), MmapSource('testsv2/test16.in')]:
+      with self.subTest(source=type(source).__name__):
+        interpreter = interpreterv2.Interpreter(False, source)
+        interpreter.load(read_lines('testsv2/test16.src'))
+        interpreter.execute()
+        self.assertEqual(interpreter.get_output(), expected)
+        interpreter.execute()
+        self.assertEqual(interpreter.get_output(), expected)
+        source.close()
+
+  # input given to execute() replaces the last run's, which is closed
+  def test_execute_with_new_input(self):
+    first = StreamSource('testsv2/test16.in')
+    interpreter = interpreterv2.Interpreter(False, first)
+    interpreter.load(read_lines('testsv2/test16.src'))
+    interpreter.execute()
+    self.assertIsNotNone(first.file)  # test16 reads one line, so its file is still open
+    interpreter.execute(['21'])
+    self.assertIsNone(first.file)
+    self.assertEqual(interpreter.get_output()[-1], '22')
+
+class MaxDepthTest(unittest.TestCase):
+  # down n makes n+1 nested calls, so with main's frame it needs n+2 frames
+  PROGRAM = program('''func main void
+  funccall down 10
+  funccall print resulti
+  funccall loop 50
+endfunc
+func down n:int int
+  if == n 0
+    return 0
+  endif
+  var int m
+  assign m - n 1
+  funccall down m
+  return + resulti 1
+endfunc
+func loop n:int void
+  if == n 0
+    return
+  endif
+  var int m
+  assign m - n 1
+  funccall loop m
+endfunc''')
+
+  # the RESOURCE_ERROR is reported on the funccall that would go one frame too deep
+  def test_exceeded(self):
+    interpreter = interpreterv2.Interpreter(False, max_depth=11)
+    with self.assertRaises(Exception):
+      interpreter.run(MaxDepthTest.PROGRAM)
+    self.assertEqual(interpreter.get_error_type_and_line(), (interpreterv2.ErrorType.RESOURCE_ERROR, 11))
+
+  # tail calls (all of loop's) reuse their caller's frame, so they never count
+  def test_within_limit(self):
+    interpreter = interpreterv2.Interpreter(False, max_depth=12)
+    interpreter.run(MaxDepthTest.PROGRAM)
+    self.assertEqual(interpreter.get_output(), ['10'])
+
+class MemoryMeterTest(unittest.TestCase):
+  # t is declared and dropped by each pass of the loop; grow recurses (not in tail position)
+  # three deep, writing s and n back to its caller each time
+  PROGRAM = program('''func main void
+  var string s
+  var int i n
+  while < i 3
+    var string t
+    assign t "abcd"
+    assign i + i 1
+  endwhile
+  funccall grow s n
+  funccall print s " " n
+endfunc
+func grow s:refstring n:refint void
+  assign s + s "xy"
+  assign n + n 1
+  if < n 3
+    funccall grow s n
+  endif
+endfunc''')
+
+  def run_metered(self, meter):
+    self.interpreter = interpreterv2.Interpreter(False, memory=meter)
+    self.interpreter.run(MemoryMeterTest.PROGRAM)
+    return self.interpreter
+
+  def test_counters(self):
+    meter = MemoryMeter()
+    self.assertEqual(self.run_metered(meter).get_output(), ['xyxyxy 3'])
+    # main's s, i and n are left, with s holding "xyxyxy"
+    self.assertEqual((meter.variables, meter.string_bytes, meter.depth), (3, 6, 1))
+    # main's three and t, plus s and n for each of the three grows
+    self.assertEqual(meter.peak_variables, 9)
+    # "", "xy", "xyxy" and "xyxyxy", one per level, in the deepest grow
+    self.assertEqual(meter.peak_string_bytes, 12)
+    self.assertEqual(meter.peak_depth, 4)
+    self.assertEqual((meter.output_lines, meter.output_bytes), (1, 9))
+
+  # going over a cap is a RESOURCE_ERROR on the line that went over it
+  def test_caps(self):
+    for meter, line in [(MemoryMeter(max_variables=4), 8), (MemoryMeter(max_string_bytes=5), 12),
+                        (MemoryMeter(max_output_bytes=5), 9)]:
+      with self.subTest(line=line):
+        with self.assertRaises(Exception):
+          self.run_metered(meter)
+        self.assertEqual(self.interpreter.get_error_type_and_line(), (interpreterv2.ErrorType.RESOURCE_ERROR, line))
+
+  # a tail call drops its caller's variables as it replaces the frame, so 50 of them in a row
+  # never hold more than one frame's worth
+  def test_tail_calls(self):
+    meter = MemoryMeter(max_variables=3)
+    interpreter = interpreterv2.Interpreter(False, memory=meter)
+    interpreter.run(program('''func main void
+  funccall loop 50
+endfunc
+func loop n:int void
+  if == n 0
+    return
+  endif
+  var int m
+  assign m - n 1
+  funccall loop m
+endfunc'''))
+    self.assertEqual((meter.peak_variables, meter.peak_depth, meter.variables), (2, 2, 0))
+
+class BuiltinTest(unittest.TestCase):
+  def interpreter(self):
+    interpreter = interpreterv2.Interpreter(False)
+    interpreter.register_builtin('sum', lambda _, args: int_value(sum(arg.value() for arg in args)))
+    interpreter.register_builtin('shout', lambda _, args: Value(Type.STRING, args[0].value().upper()))
+    interpreter.register_builtin('odd', lambda _, args: bool_value(args[0].value() % 2 == 1))
+    return interpreter
+
+  # a builtin's return value lands in the result variable for its type
+  def test_results(self):
+    interpreter = self.interpreter()
+    interpreter.run(program('''func main void
+  funccall sum 1 2 3
+  funccall print resulti
+  funccall shout "hi"
+  funccall print results
+  funccall odd 7
+  funccall print resultb
+endfunc'''))
+    self.assertEqual(interpreter.get_output(), ['6', 'HI', 'True'])
+
+  # a builtin shadows a user function of the same name
+  def test_shadows_user_function(self):
+    interpreter = self.interpreter()
+    interpreter.run(program('''func sum a:int b:int int
+  return 0
+endfunc
+func main void
+  funccall sum 4 5
+  funccall print resulti
+endfunc'''))
+    self.assertEqual(interpreter.get_output(), ['9'])
+
+class CheckTypesTest(unittest.TestCase):
+  # every static type error names its types the same way
+  def test_messages(self):
+    interpreter = interpreterv2.Interpreter(False)
+    errors = interpreter.check_types(program('''func main void
+  var int x
+  var string s
+  assign x + x s
+  assign s - s s
+  assign x ! x
+  assign x s
+endfunc'''))
+    self.assertEqual(errors, [(3, 'Mismatching types INT and STRING'), (4, 'Operator - is not compatible with STRING'),
+                              (5, 'Expecting boolean for ! INT'), (6, 'Assigning STRING to x, declared INT')])
+
+class ProgramCacheTest(unittest.TestCase):
+  # the same text with one line break moved: x declared then printed, or x declared twice
+  SPLIT = ['func main void', '  var int x', '  funccall print x', 'endfunc']
+  JOINED = ['func main void', '  var int x  funccall print x', 'endfunc']
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.addCleanup(self.directory.cleanup)
+
+  def interpreter(self):
+    return interpreterv2.Interpreter(False, cache_dir=self.directory.name)
+
+  def test_line_breaks_change_the_key(self):
+    cache = ProgramCache(self.directory.name, interpreterv2.Interpreter.CACHE_VERSION)
+    self.assertNotEqual(cache.key(ProgramCacheTest.SPLIT), cache.key(ProgramCacheTest.JOINED))
+
+  def test_programs_differing_in_line_breaks(self):
+    interpreter = self.interpreter()
+    interpreter.load(ProgramCacheTest.SPLIT)
+    interpreter.execute()
+    self.assertEqual(interpreter.get_output(), ['0'])
+    interpreter = self.interpreter()
+    interpreter.load(ProgramCacheTest.JOINED)
+    with self.assertRaises(Exception):
+      interpreter.execute()
+    self.assertEqual(interpreter.get_error_type_and_line(), (interpreterv2.ErrorType.NAME_ERROR, 1))
+
+  # a warm entry is loaded without scanning the program, validation included
+  def test_hit_skips_the_scan(self):
+    self.interpreter().load(ProgramCacheTest.SPLIT)
+    interpreter = self.interpreter()
+    interpreter.validate_program(ProgramCacheTest.SPLIT)
+    interpreter.run(ProgramCacheTest.SPLIT)
+    self.assertEqual(interpreter.get_output(), ['0'])
+    self.assertEqual(interpreter.chunks, {})  # what _scan_program leaves behind
+
+  # only programs that passed validate_program are stored
+  def test_unvalidated_programs_are_not_stored(self):
+    interpreter = self.interpreter()
+    interpreter.run(ProgramCacheTest.SPLIT)
+    self.assertEqual(os.listdir(self.directory.name), [])
+
+if __name__ == '__main__':
+  unittest.main()
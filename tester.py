@@ -1,9 +1,11 @@
+import argparse
 import importlib
 from os import environ
-import sys
+from os.path import exists
 import traceback
 from operator import itemgetter
 
+from input_v1 import StreamSource
 from harness import AbstractTestScaffold, run_all_tests, get_score, write_gradescope_output, exit_after, timeout
 
 # TODO: documentation :)
@@ -14,17 +16,22 @@ class TestScaffold(AbstractTestScaffold):
     self.interpreter_lib = interpreter_lib
     self.interpreter = None
 
+  # modules can't be pickled; workers started by run_tests_in_pool re-import by name instead
+  def __getstate__(self):
+    return {'interpreter_lib': self.interpreter_lib.__name__}
+
+  def __setstate__(self, state):
+    self.interpreter_lib = importlib.import_module(state['interpreter_lib'])
+    self.interpreter = None
+
   def setup(self, test_case):
     inputfile, solfile, srcfile = itemgetter('inputfile', 'solfile', 'srcfile')(test_case)
 
     with open(solfile) as handle:
       expected = list(map(lambda x:x.rstrip('\n'), handle.readlines()))
 
-    try:
-      with open(inputfile) as handle:
-        input = list(map(lambda x:x.rstrip('\n'), handle.readlines()))
-    except:
-      input = None
+    # read lazily, so the file is only opened (and only one line held) if the program asks for input
+    input = StreamSource(inputfile) if exists(inputfile) else None
 
     with open(srcfile) as handle:
       program = handle.readlines()
@@ -45,7 +52,7 @@ class TestScaffold(AbstractTestScaffold):
   @timeout(6) # more aggressive timeout to deal with accidental infinite loops that pauses interrupts
   def run_test_case(self, test_case, environment):
     expect_failure = itemgetter('expect_failure')(test_case)
-    expected, program = itemgetter('expected', 'program')(environment)
+    expected, program, input = itemgetter('expected', 'program', 'input')(environment)
     try:
       self.interpreter.run(program)
     except Exception as e:
@@ -63,6 +70,9 @@ class TestScaffold(AbstractTestScaffold):
       print(e)
       traceback.print_exc()
       return 0
+    finally:
+      if input:
+        input.close()
 
     if expect_failure:
       print('\nExpected failure:')
@@ -109,7 +119,7 @@ def generate_test_suite_v1(version):
   )
 
 def generate_test_suite_v2(version):
-  successes = {2, 3, 6, 7, 8, 10, 11, 12, 13, 16, 22, 47, 50, 53, 55}
+  successes = {2, 3, 6, 7, 8, 10, 11, 12, 13, 16, 22, 47, 50, 53, 55, 60, 61, 62, 63, 64, 65}
   fails = {3, 4, 8, 9, 10, 20, 21, 23, 24, 27}
   return generate_test_case_structure(
     successes,
@@ -125,9 +135,11 @@ def generate_test_suite_v2(version):
 
 # main entrypoint - just calls functions :)
 def main():
-  if not sys.argv:
-    print('Error: Missing version number argument')
-  version = sys.argv[1]
+  parser = argparse.ArgumentParser()
+  parser.add_argument('version', help='interpreter version to test, e.g. 2')
+  parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes to run tests on')
+  args = parser.parse_args()
+  version = args.version
   module_name = f'interpreterv{version}'
   interpreter = importlib.import_module(module_name)
 
@@ -139,7 +151,7 @@ def main():
     case "2":
       tests = generate_test_suite_v2(version)
 
-  results = run_all_tests(scaffold, tests)
+  results = run_all_tests(scaffold, tests, args.jobs)
   total_score = get_score(results) / len(results) * 100.0
   print(f"Total Score: {total_score:9.2f}%")
 
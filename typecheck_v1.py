@@ -0,0 +1,103 @@
+from intbase import InterpreterBase
+from func_v1 import FunctionManager
+
+# TypeInference works out, before a program runs, which variables are guaranteed to hold values
+# of one type, so the compiler can type check expressions ahead of time and drop the run-time
+# checks from the ones that pass (see Compiler.typed).
+#
+# Every call runs in a fresh environment, so a name in a function's body only ever refers to
+# that function's own bindings of it: its parameters, its var declarations and the result
+# variables its calls set. Assignments are checked, so a binding keeps its declared type, with
+# three exceptions that are tracked here, per function and per name, as the set of types that
+# name's bindings might hold:
+#   - literal call arguments aren't type checked, so a parameter gets the type of every literal
+#     that's passed to it
+#   - a by-ref parameter writes back whatever its name's innermost binding holds when the call
+#     returns, which may be a variable of another type that shadows it; the caller's variable
+#     gets every type the callee's bindings of that name might hold (and so on up, through the
+#     caller's own by-ref parameters)
+#   - every call that returns (re)declares resulti, results or resultb in the caller
+# A name is typed only if its set has exactly one type.
+# Given roots (function names, e.g. main), only the functions they can call, directly or not, are
+# looked at: calls made by functions that never run can't change anything, and those functions
+# are left untyped.
+class TypeInference:
+  def __init__(self, interpreter, tokenized_program, roots=None):
+    self.func_manager = interpreter.func_manager
+    self.possible = {}  # function start_ip -> {name: set of Types that name's bindings might hold}
+    self._infer(interpreter, tokenized_program, roots)
+
+  # the FuncInfo for the function declared on this line, or None if it can never run (e.g. one
+  # that a later definition of the same name replaces)
+  def function_at(self, line_num, tokens):
+    func_info = self.func_manager.get_function_info(tokens[1]) if len(tokens) > 1 else None
+    if func_info is None or func_info.start_ip != line_num + 1:
+      return None
+    return func_info
+
+  # the Type every binding of name in func_info's body is sure to hold, or None
+  def variable_type(self, func_info, name):
+    possible = self.possible.get(func_info.start_ip)
+    types = possible.get(name) if possible is not None else None
+    if types is None or len(types) != 1:
+      return None
+    for type in types:
+      return type
+
+  # adds the types func_info's own declarations give its names to possible, and its calls of user
+  # functions to calls; returns the functions it calls
+  def _scan_function(self, interpreter, tokenized_program, func_info, calls):
+    possible = self.possible[func_info.start_ip] = {
+      result_name: {type} for type, result_name in FunctionManager.RETURN_TYPES.values() if type}
+    for param, type, by_ref in func_info.params:
+      possible.setdefault(param, set()).add(type)
+    callees = []
+    for line_num in range(func_info.start_ip, len(tokenized_program)):
+      tokens = tokenized_program[line_num]
+      if not tokens:
+        continue
+      if tokens[0] == InterpreterBase.FUNC_DEF or tokens[0] == InterpreterBase.ENDFUNC_DEF:
+        break
+      if tokens[0] == InterpreterBase.VAR_DEF and len(tokens) > 1 and tokens[1] in interpreter.VAR_TYPES:
+        for name in tokens[2:]:
+          possible.setdefault(name, set()).add(interpreter.VAR_TYPES[tokens[1]])
+      elif tokens[0] == InterpreterBase.FUNCCALL_DEF and len(tokens) > 1 and tokens[1] not in interpreter.builtins:
+        callee = self.func_manager.get_function_info(tokens[1])
+        if callee is not None and not callee.duplicate_params and len(callee.params) == len(tokens) - 2:
+          calls.append((func_info, callee, tokens[2:]))
+          callees.append(callee)
+    return callees
+
+  def _infer(self, interpreter, tokenized_program, roots):
+    calls = []  # (caller, callee, argument tokens) for every call of a user function
+    if roots is None:
+      pending = list(self.func_manager.func_cache.values())
+    else:
+      pending = [self.func_manager.get_function_info(name) for name in roots]
+    while pending:
+      func_info = pending.pop()
+      if func_info is not None and func_info.start_ip not in self.possible:
+        callees = self._scan_function(interpreter, tokenized_program, func_info, calls)
+        if roots is not None:
+          pending += callees
+
+    for caller, callee, args in calls:
+      for (param, type, by_ref), arg in zip(callee.params, args):
+        try:
+          literal = interpreter._parse_literal(arg)
+        except ValueError:
+          literal = None  # the call fails before the parameter is bound
+        if literal is not None:
+          self.possible[callee.start_ip][param].add(literal.type())
+
+    changed = True
+    while changed:
+      changed = False
+      for caller, callee, args in calls:
+        for (param, type, by_ref), arg in zip(callee.params, args):
+          if by_ref:
+            written = self.possible[callee.start_ip][param]
+            target = self.possible[caller.start_ip].setdefault(arg, set())
+            if not written <= target:
+              target |= written
+              changed = True
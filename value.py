@@ -0,0 +1,93 @@
+from type import Type
+
+# Represents a value, which has a type and its value.
+# Values are shared freely: assignment, parameter passing and result variables all store the
+# same object rather than a copy, and the interpreter never changes a Value in place (a new
+# binding always gets a new Value). That is what lets True/False and small ints be interned
+# below. set() is only for a Value you own, i.e. one you made yourself or got from copy().
+class Value:
+  __slots__ = ('t', 'v')
+
+  def __init__(self, type, value = None):
+    self.t = type
+    self.v = value
+
+  def value(self):
+    return self.v
+
+  def set(self, other):
+    self.t = other.t
+    self.v = other.v
+
+  def copy(self):
+    return Value(self.t, self.v)
+
+  def type(self):
+    return self.t
+
+  # the length of a string value; a RopeValue knows it without building the string
+  def length(self):
+    return len(self.v)
+
+# An interned Value is shared by the whole interpreter, so it refuses to be changed in place
+class _InternedValue(Value):
+  __slots__ = ()
+
+  def set(self, other):
+    raise TypeError(f'cannot set interned value {self.v!r}; copy() it first')
+
+TRUE = _InternedValue(Type.BOOL, True)
+FALSE = _InternedValue(Type.BOOL, False)
+EMPTY_STRING = _InternedValue(Type.STRING, "")
+
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+_small_ints = [_InternedValue(Type.INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+def int_value(i):
+  if SMALL_INT_MIN <= i <= SMALL_INT_MAX:
+    return _small_ints[i - SMALL_INT_MIN]
+  return Value(Type.INT, i)
+
+def bool_value(b):
+  return TRUE if b else FALSE
+
+# A string built by +, kept as the pieces it was appended from, so a loop that grows a string a
+# bit at a time (assign s + s "x") costs O(1) per append instead of a copy of everything so far.
+# The pieces are joined (once) when the string's value is first needed, e.g. to print or compare it.
+# A rope that's appended to shares its list of pieces with the result: each rope owns the first
+# count pieces, and only the newest one, which owns all of them, can append to the list in place.
+class RopeValue(Value):
+  __slots__ = ('parts', 'count', 'size', 'joined')
+
+  def __init__(self, parts, count, size):
+    self.t = Type.STRING
+    self.parts = parts
+    self.count = count
+    self.size = size
+    self.joined = None
+
+  @property
+  def v(self):
+    if self.joined is None:
+      parts = self.parts
+      self.joined = ''.join(parts if self.count == len(parts) else parts[:self.count])
+    return self.joined
+
+  def set(self, other):
+    raise TypeError('cannot set a rope value; copy() it first')
+
+  def length(self):
+    return self.size
+
+ROPE_MIN_LENGTH = 256  # shorter strings are cheaper to copy than to keep in pieces
+
+# the string Value a + b
+def concat(a, b):
+  if type(a) is RopeValue and a.count == len(a.parts):
+    a.parts.append(b.v)
+    return RopeValue(a.parts, a.count + 1, a.size + b.length())
+  size = a.length() + b.length()
+  if size < ROPE_MIN_LENGTH:
+    return Value(Type.STRING, a.v + b.v)
+  return RopeValue([a.v, b.v], 2, size)